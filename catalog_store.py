@@ -0,0 +1,442 @@
+from PyQt5.QtCore import QAbstractProxyModel, QAbstractTableModel, QModelIndex, Qt
+
+from image_loader import PLACEHOLDER_TEXT
+from reports import format_price
+
+STORE_PAGE_SIZE = 1000
+
+NAME, IMAGE, CATEGORY, FULL_CATEGORY, DESCRIPTION, AMOUNT, PRICE, EDIT, DELETE = range(9)
+STORE_HEADERS = ['Наименование', 'Изображение', 'Категория', 'Категория', 'Описание', 'Количество', 'Цена', '', '']
+# Представления показывают подмножество столбцов хранилища в том же порядке.
+CATALOG_COLUMNS = (NAME, IMAGE, CATEGORY, AMOUNT, PRICE)
+PRODUCT_COLUMNS = (NAME, IMAGE, FULL_CATEGORY, DESCRIPTION, AMOUNT, PRICE, EDIT, DELETE)
+
+
+class ProductStore(QAbstractTableModel):
+    # Все товары хранятся один раз в виде столбцов; каталог и таблица товаров читают их через CatalogProxyModel.
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.page_size = STORE_PAGE_SIZE
+        self.load_page = None
+        self.last_key = None
+        self.has_more = False
+        self.load_all = False
+        self.loading = False
+        self.total = None
+        self.exact_total = False
+        self._clear()
+
+    def _clear(self):
+        self.ids = []
+        self.names = []
+        self.image_ids = []
+        self.categories = []
+        self.parent_categories = []
+        self.descriptions = []
+        self.amounts = []
+        self.prices = []
+        self.rows = {}
+
+    def _columns(self):
+        return (self.ids, self.names, self.image_ids, self.categories, self.parent_categories, self.descriptions,
+                self.amounts, self.prices)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.ids)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(STORE_HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return STORE_HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row, column = index.row(), index.column()
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            if column == NAME:
+                return self.names[row]
+            if column == IMAGE:
+                return PLACEHOLDER_TEXT
+            if column == CATEGORY:
+                return self.categories[row]
+            if column == FULL_CATEGORY:
+                return f'{self.categories[row]} - {self.parent_categories[row]}'
+            if column == DESCRIPTION:
+                return self.descriptions[row]
+            if column == AMOUNT:
+                return str(self.amounts[row])
+            if column == PRICE:
+                return format_price(self.prices[row])
+            return None
+        if role == Qt.UserRole:
+            if column == NAME:
+                return self.ids[row]
+            if column == IMAGE:
+                return self.image_ids[row]
+            if column == PRICE:
+                return self.prices[row]
+            return None
+        if role == Qt.TextAlignmentRole and column == IMAGE:
+            return Qt.AlignCenter
+        return None
+
+    def sort_key(self, column):
+        # Ключ сортировки строки хранилища; сортировка выполняется sorted() без обращений к data().
+        if column == NAME:
+            # Страницы идут по name COLLATE "C", то есть по кодам символов, как и сравнение строк в Python.
+            return self.names.__getitem__
+        if column == CATEGORY:
+            return lambda row: self.categories[row].lower()
+        if column == FULL_CATEGORY:
+            return lambda row: (self.categories[row].lower(), self.parent_categories[row].lower())
+        if column == DESCRIPTION:
+            return lambda row: self.descriptions[row].lower()
+        if column == AMOUNT:
+            return self.amounts.__getitem__
+        if column == PRICE:
+            return self.prices.__getitem__
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.has_more and not self.loading
+
+    def fetchMore(self, parent=QModelIndex()):
+        if self.canFetchMore(parent):
+            self.set_loading(True)
+            self.load_page(self.last_key, self.page_size)
+
+    def reload(self, load_page):
+        # Страницы идут по названию, как и порядок представлений по умолчанию, поэтому, как и в PagedTableModel,
+        # следующая страница запрашивается через fetchMore, когда прокрутка доходит до конца.
+        self.load_page = load_page
+        self.last_key = None
+        self.has_more = True
+        self.load_all = False
+        self.loading = False
+        self.total = None
+        self.beginResetModel()
+        self._clear()
+        self.endResetModel()
+        self.fetchMore()
+
+    def fetch_all(self):
+        # Отбор, поиск и сортировка по столбцу нужны по всему каталогу: оставшиеся страницы загружаются подряд.
+        self.load_all = True
+        self.fetchMore()
+
+    def add_page(self, result):
+        records, total = result
+        if total is not None:
+            self.total, self.exact_total = total
+        self.upsert(records)
+        if records:
+            self.last_key = (records[-1][1], records[-1][0])
+        self.has_more = len(records) == self.page_size
+        self.set_loading(False)
+        if self.load_all:
+            self.fetchMore()
+
+    def load_failed(self, error):
+        self.set_loading(False)
+        print(f'Ошибка: {error}')
+
+    def set_loading(self, loading):
+        self.loading = loading
+        self.headerDataChanged.emit(Qt.Horizontal, 0, 0)
+
+    def upsert(self, records):
+        # Строка, уже пришедшая через patch, не дублируется следующей страницей.
+        new_records = []
+        for record in records:
+            row = self.rows.get(record[0])
+            if row is None:
+                new_records.append(record)
+                continue
+            for column, value in zip(self._columns(), record):
+                column[row] = value
+            self.dataChanged.emit(self.index(row, 0), self.index(row, len(STORE_HEADERS) - 1))
+        if not new_records:
+            return
+        first = len(self.ids)
+        self.beginInsertRows(QModelIndex(), first, first + len(new_records) - 1)
+        for row, record in enumerate(new_records, first):
+            for column, value in zip(self._columns(), record):
+                column.append(value)
+            self.rows[record[0]] = row
+        self.endInsertRows()
+
+    def remove(self, product_id):
+        row = self.rows.get(product_id)
+        if row is None:
+            return
+        self.beginRemoveRows(QModelIndex(), row, row)
+        for column in self._columns():
+            del column[row]
+        self.rows = {id_product: index for index, id_product in enumerate(self.ids)}
+        if self.total is not None:
+            self.total -= 1
+        self.endRemoveRows()
+
+    def patch(self, product_ids, records):
+        records = {record[0]: record for record in records}
+        self.upsert(list(records.values()))
+        for product_id in product_ids:
+            if product_id not in records:
+                self.remove(product_id)
+
+
+class CatalogProxyModel(QAbstractProxyModel):
+    # Отбор и сортировка строк хранилища для одного представления. Порядок строк хранится списком номеров строк
+    # хранилища; изменённые и новые строки переставляются двоичным поиском, не пересортировывая остальные.
+    def __init__(self, store, columns, parent=None):
+        super().__init__(parent)
+        self.columns = columns
+        self.category = None
+        self.search_ranks = None
+        self.sort_column = None
+        self.sort_order = Qt.AscendingOrder
+        self.source_rows = []
+        self._positions = None
+        self.setSourceModel(store)
+        store.modelReset.connect(self.rebuild)
+        store.rowsInserted.connect(self.source_rows_inserted)
+        store.rowsRemoved.connect(self.source_rows_removed)
+        store.dataChanged.connect(self.source_data_changed)
+        store.headerDataChanged.connect(self.count_changed)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.source_rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def index(self, row, column, parent=QModelIndex()):
+        if parent.isValid() or not (0 <= row < len(self.source_rows) and 0 <= column < len(self.columns)):
+            return QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index=QModelIndex()):
+        return QModelIndex()
+
+    def canFetchMore(self, parent=QModelIndex()):
+        # Результаты поиска загружаются целиком, следующие страницы каталога к ним ничего не добавят.
+        return not parent.isValid() and self.search_ranks is None and self.sourceModel().canFetchMore()
+
+    def fetchMore(self, parent=QModelIndex()):
+        if self.canFetchMore(parent):
+            self.sourceModel().fetchMore()
+
+    def positions(self):
+        # Обратное отображение строка хранилища -> строка представления, строится заново после перестановок.
+        if self._positions is None:
+            self._positions = {source_row: row for row, source_row in enumerate(self.source_rows)}
+        return self._positions
+
+    def mapToSource(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        return self.sourceModel().index(self.source_rows[index.row()], self.columns[index.column()])
+
+    def mapFromSource(self, index):
+        row = self.positions().get(index.row()) if index.isValid() else None
+        if row is None or index.column() not in self.columns:
+            return QModelIndex()
+        return self.index(row, self.columns.index(index.column()))
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        store = self.sourceModel()
+        return store.data(store.index(self.source_rows[index.row()], self.columns[index.column()]), role)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation != Qt.Horizontal:
+            return super().headerData(section, orientation, role)
+        header = self.sourceModel().headerData(self.columns[section], orientation, role)
+        if section == 0 and role == Qt.DisplayRole:
+            store = self.sourceModel()
+            if self.search_ranks is not None or not store.has_more:
+                return f'{header} ({len(self.source_rows)})'
+            # Пока каталог загружен не полностью, рядом с загруженными строками показывается общее число товаров.
+            if self.category is None and store.total is not None:
+                return f'{header} ({len(self.source_rows)} из {"" if store.exact_total else "≈"}{store.total})'
+            return f'{header} ({len(self.source_rows)}…)'
+        return header
+
+    def count_changed(self, *args):
+        self.headerDataChanged.emit(Qt.Horizontal, 0, 0)
+
+    def accepts(self, source_row):
+        store = self.sourceModel()
+        if self.category is not None and store.categories[source_row] != self.category:
+            return False
+        if self.search_ranks is not None:
+            return store.ids[source_row] in self.search_ranks
+        return True
+
+    def order_key(self):
+        # Без выбранного столбца результаты поиска идут по релевантности, остальные строки - по названию.
+        store = self.sourceModel()
+        if self.sort_column is not None:
+            return store.sort_key(self.columns[self.sort_column]), self.sort_order == Qt.DescendingOrder
+        if self.search_ranks is not None:
+            return lambda row: self.search_ranks[store.ids[row]], False
+        return store.sort_key(NAME), False
+
+    def ordered(self, source_rows):
+        # Равные по ключу строки идут в порядке хранилища, как и при вставке через insert_position.
+        rows = sorted(row for row in source_rows if self.accepts(row))
+        key, reverse = self.order_key()
+        if key is not None:
+            rows.sort(key=key, reverse=reverse)
+        return rows
+
+    def comes_after(self, source_row, other, key, reverse):
+        # Тот же порядок, что у ordered(): по ключу, при равенстве - по номеру строки хранилища.
+        if key is not None:
+            value, other_value = key(source_row), key(other)
+            if value != other_value:
+                return value < other_value if reverse else value > other_value
+        return source_row > other
+
+    def insert_position(self, source_row, key, reverse):
+        low, high = 0, len(self.source_rows)
+        while low < high:
+            middle = (low + high) // 2
+            if self.comes_after(self.source_rows[middle], source_row, key, reverse):
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+    def in_order(self, row, key, reverse):
+        # Если каждая строка стоит после предыдущей, весь список упорядочен.
+        source_row = self.source_rows[row]
+        if row > 0 and not self.comes_after(source_row, self.source_rows[row - 1], key, reverse):
+            return False
+        if row + 1 < len(self.source_rows) and not self.comes_after(self.source_rows[row + 1], source_row, key,
+                                                                    reverse):
+            return False
+        return True
+
+    def rebuild(self):
+        self.beginResetModel()
+        self.source_rows = self.ordered(range(self.sourceModel().rowCount()))
+        self._positions = None
+        self.endResetModel()
+        self.count_changed()
+        self.fetch_all_if_needed()
+
+    def fetch_all_if_needed(self):
+        # Найденные товары загружаются вместе с результатами поиска, а sort_key(NAME) сравнивает названия так же,
+        # как ORDER BY name COLLATE "C" у страниц; отбор по категории и другие сортировки требуют всего каталога.
+        if self.search_ranks is not None:
+            return
+        by_name = self.sort_column is None or (self.columns[self.sort_column] == NAME
+                                               and self.sort_order == Qt.AscendingOrder)
+        if self.category is not None or not by_name:
+            self.sourceModel().fetch_all()
+
+    def set_filter(self, category=None, search_ranks=None):
+        self.category = category
+        self.search_ranks = search_ranks
+        self.rebuild()
+
+    def show_search_results(self, records):
+        # records - пары (id_product, сходство), уже упорядоченные по убыванию сходства.
+        self.set_filter(search_ranks={id_product: rank for rank, (id_product, _) in enumerate(records)})
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sort_column = column if column >= 0 else None
+        self.sort_order = order
+        self.layoutAboutToBeChanged.emit()
+        old_rows = self.source_rows
+        self.source_rows = self.ordered(old_rows)
+        self._positions = None
+        positions = self.positions()
+        old_indexes = self.persistentIndexList()
+        self.changePersistentIndexList(old_indexes, [
+            self.index(positions[old_rows[index.row()]], index.column()) for index in old_indexes])
+        self.layoutChanged.emit()
+        self.fetch_all_if_needed()
+
+    def remove_rows(self, rows):
+        for first, last in reversed(runs(sorted(rows))):
+            self.beginRemoveRows(QModelIndex(), first, last)
+            del self.source_rows[first:last + 1]
+            self._positions = None
+            self.endRemoveRows()
+
+    def insert_rows(self, source_rows):
+        # Новые строки упорядочиваются между собой, и строки с общим местом вставки вставляются одним участком.
+        key, reverse = self.order_key()
+        groups = []
+        for source_row in self.ordered(source_rows):
+            position = self.insert_position(source_row, key, reverse)
+            if groups and groups[-1][0] == position:
+                groups[-1][1].append(source_row)
+            else:
+                groups.append((position, [source_row]))
+        inserted = 0
+        for position, rows in groups:
+            first = position + inserted
+            self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+            self.source_rows[first:first] = rows
+            self._positions = None
+            self.endInsertRows()
+            inserted += len(rows)
+        return inserted
+
+    def source_rows_inserted(self, parent, first, last):
+        self.insert_rows(range(first, last + 1))
+        self.count_changed()
+
+    def source_rows_removed(self, parent, first, last):
+        count = last - first + 1
+        positions = self.positions()
+        rows = [positions[source_row] for source_row in range(first, last + 1) if source_row in positions]
+        self.source_rows = [source_row - count if source_row > last else source_row for source_row in self.source_rows]
+        self.remove_rows(rows)
+        self._positions = None
+        self.count_changed()
+
+    def source_data_changed(self, top_left, bottom_right, roles=()):
+        # Строки, оставшиеся на месте, только перерисовываются; иначе они удаляются и вставляются на новые места.
+        key, reverse = self.order_key()
+        positions = self.positions()
+        affected = range(top_left.row(), bottom_right.row() + 1)
+        rows = [positions[source_row] for source_row in affected if source_row in positions]
+        in_place = all(self.accepts(self.source_rows[row]) and self.in_order(row, key, reverse) for row in rows)
+        if in_place:
+            for row in rows:
+                self.dataChanged.emit(self.index(row, 0), self.index(row, len(self.columns) - 1))
+        else:
+            self.remove_rows(rows)
+        positions = self.positions()
+        if self.insert_rows([source_row for source_row in affected if source_row not in positions]) or not in_place:
+            self.count_changed()
+
+    def text(self, row, column):
+        if 0 <= row < len(self.source_rows):
+            return self.index(row, column).data() or ''
+        return None
+
+    def value(self, row, column):
+        if 0 <= row < len(self.source_rows):
+            return self.index(row, column).data(Qt.UserRole)
+        return None
+
+
+def runs(rows):
+    # Возрастающие номера строк -> непрерывные участки (first, last).
+    result = []
+    for row in rows:
+        if result and result[-1][1] == row - 1:
+            result[-1] = (result[-1][0], row)
+        else:
+            result.append((row, row))
+    return result
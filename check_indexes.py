@@ -0,0 +1,159 @@
+import sys
+
+import catalog_store
+import get
+import images
+import reports
+from database import get_connection
+from migrations import migrate
+
+SEED_CATEGORIES = 1000
+SEED_PRODUCTS = 100000
+SEED_ORDERS = 50000
+SEED_ORDER_LINES = 4
+
+seed_query = """
+INSERT INTO categories (name_categories)
+SELECT 'Проверка категория ' || g FROM generate_series(1, %(categories)s) g;
+
+INSERT INTO parent_category (name)
+SELECT 'Проверка родитель ' || g FROM generate_series(1, %(categories)s) g;
+
+INSERT INTO categories_parent_category (id_categories, id_parent_categories)
+SELECT C.id_categories, PC.id_parent_category
+FROM (SELECT id_categories, row_number() OVER () AS n
+      FROM categories WHERE name_categories LIKE 'Проверка %%') C
+JOIN (SELECT id_parent_category, row_number() OVER () AS n
+      FROM parent_category WHERE name LIKE 'Проверка %%') PC USING (n);
+
+WITH images AS (
+    INSERT INTO image (url)
+    SELECT decode(lpad(to_hex(g), 8, '0'), 'hex') FROM generate_series(1, %(products)s) g
+    RETURNING id_image
+), cpc AS (
+    SELECT array_agg(id_categories_parent_category) AS ids FROM categories_parent_category
+)
+INSERT INTO product (name, id_image, id_category, description, amount, price)
+SELECT 'Проверка товар ' || I.id_image, I.id_image, cpc.ids[1 + I.id_image %% array_length(cpc.ids, 1)],
+       'Описание', 100, 10
+FROM images I, cpc;
+
+INSERT INTO "order" (order_date, status)
+SELECT CURRENT_DATE - (g %% 3650), CASE WHEN g %% 100 = 0 THEN 'open' ELSE 'completed' END
+FROM generate_series(1, %(orders)s) g;
+
+INSERT INTO order_details (id_order, id_product, amount, price)
+SELECT O.id_order, P.ids[1 + (O.id_order * 7 + k) %% array_length(P.ids, 1)], 1, 10
+FROM "order" O, generate_series(1, %(lines)s) k, (SELECT array_agg(id_product) AS ids FROM product) P;
+
+ANALYZE categories, parent_category, categories_parent_category, image, product, "order", order_details;
+"""
+
+sample_query = """
+SELECT P.name, P.id_product, P.id_image, OD.id_order, O.order_date, CPC.id_categories, C.name_categories, PC.name
+FROM order_details OD
+JOIN "order" O ON OD.id_order = O.id_order
+JOIN product P ON OD.id_product = P.id_product
+JOIN categories_parent_category CPC ON P.id_category = CPC.id_categories_parent_category
+JOIN categories C ON CPC.id_categories = C.id_categories
+JOIN parent_category PC ON CPC.id_parent_categories = PC.id_parent_category
+WHERE P.name LIKE 'Проверка %'
+LIMIT 1;
+"""
+
+# Запросы берутся из модулей приложения, чтобы проверка не расходилась с тем, что выполняется на самом деле.
+# Отчёты product_quantity, categories_count и order_count и списки категорий читают таблицы целиком и не проверяются.
+prepared_queries = ('get_category_id', 'get_product_id', 'get_order_quantity')
+
+
+def execute_prepared(name, count):
+    return f'EXECUTE {name} ({", ".join(["%s"] * count)})'
+
+
+checked_queries = [
+    ('get_category_id', execute_prepared('get_category_id', 1), lambda s: (s['category_name'],)),
+    ('get_parent_category_id', get.parent_category_id_query, lambda s: (s['parent_category_name'],)),
+    ('get_product_id', execute_prepared('get_product_id', 1), lambda s: (s['product_name'],)),
+    ('get_products_facts_by_names', get.products_facts_by_names_query, lambda s: ([s['product_name']],)),
+    ('get_image_for_product', get.image_for_product_query, lambda s: (s['product_name'],)),
+    ('get_order_quantity', execute_prepared('get_order_quantity', 2), lambda s: (s['order_id'], s['product_id'])),
+    ('get_order_details', get.order_details_query, lambda s: (s['order_id'],)),
+    ('categories_in_open_order', get.categories_in_open_order_query,
+     lambda s: (s['category_id'], s['category_id'])),
+    ('product_in_open_order', get.product_in_open_order_query, lambda s: (s['product_id'],)),
+    ('categories_in_order', get.categories_in_order_query, lambda s: (s['category_id'], s['category_id'])),
+    ('product_in_order', get.product_in_order_query, lambda s: (s['product_id'],)),
+    ('collect_unused_images', images.collect_unused_images_query, lambda s: (images.IMAGE_GC_BATCH_SIZE,)),
+    ('store_image', images.store_image_query, lambda s: ('0' * 64, 0, 0)),
+    ('get_products_page', get.page_query(get.products_query, get.product_page_key, after=True),
+     lambda s: ((s['product_name'], s['product_id']), catalog_store.STORE_PAGE_SIZE)),
+    ('get_products_by_ids', get.products_by_ids_query, lambda s: ([s['product_id']],)),
+    ('search_products', get.search_products_query, lambda s: {
+        'text': s['product_name'], 'pattern': get.like_pattern(s['product_name']), 'limit': get.SEARCH_LIMIT}),
+    ('search_products_fulltext', get.fulltext_search_query.format(query=get.fulltext_query('"фраза"')[0]),
+     lambda s: [s['product_name'], get.SEARCH_LIMIT]),
+    ('get_thumbnail_hashes', get.thumbnail_hashes_query, lambda s: ([s['image_id']],)),
+    ('get_thumbnails', get.thumbnails_query, lambda s: ([s['image_id']],)),
+    ('get_orders_page', get.page_query(get.orders_query, get.order_page_key, after=True),
+     lambda s: ((s['order_id'],), get.PAGE_SIZE)),
+    ('get_orders_by_ids', get.orders_by_ids_query, lambda s: ([s['order_id']],)),
+    ('product_quantity_date', reports.product_quantity_date_query, lambda s: (s['order_date'],)),
+]
+
+
+def seq_scans(plan):
+    relations = []
+    if plan['Node Type'] == 'Seq Scan':
+        relations.append(plan['Relation Name'])
+    for child in plan.get('Plans', []):
+        relations.extend(seq_scans(child))
+    return relations
+
+
+def check_plans(cursor, sample):
+    for name in prepared_queries:
+        get.statements.prepare(cursor, name)
+    failures = []
+    for name, query, params in checked_queries:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + query, params(sample))
+        plan = cursor.fetchone()[0][0]['Plan']
+        relations = seq_scans(plan)
+        if relations:
+            failures.append((name, relations))
+            print(f'{name}: последовательное сканирование {", ".join(relations)}')
+        else:
+            print(f'{name}: OK')
+    return failures
+
+
+def main():
+    migrate()
+    with get_connection() as connection, connection.cursor() as cursor:
+        try:
+            cursor.execute(seed_query, {
+                'categories': SEED_CATEGORIES,
+                'products': SEED_PRODUCTS,
+                'orders': SEED_ORDERS,
+                'lines': SEED_ORDER_LINES,
+            })
+            cursor.execute(sample_query)
+            product_name, product_id, image_id, order_id, order_date, category_id, category_name, \
+                parent_category_name = cursor.fetchone()
+            failures = check_plans(cursor, {
+                'product_name': product_name,
+                'product_id': product_id,
+                'image_id': image_id,
+                'order_id': order_id,
+                'order_date': order_date,
+                'category_id': category_id,
+                'category_name': category_name,
+                'parent_category_name': parent_category_name,
+            })
+        finally:
+            connection.rollback()
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,4 +1,11 @@
+import threading
+import time
+from contextlib import contextmanager
+
 import psycopg2
+import psycopg2.extensions
+
+from instrumentation import InstrumentedCursor
 
 db = {
     'dbname': 'db_psql_dan',
@@ -7,96 +14,136 @@ db = {
     'host': '5.183.188.132',
     'port': '5432'
 }
-create_table_query = """
-CREATE TABLE IF NOT EXISTS public.categories
-(
-    id_categories integer NOT NULL DEFAULT nextval('categories_id_categories_seq'::regclass),
-    name_categories text COLLATE pg_catalog."default" NOT NULL,
-    CONSTRAINT categories_pkey PRIMARY KEY (id_categories),
-    CONSTRAINT unique_name_categories UNIQUE (name_categories)
-);
-
-CREATE TABLE IF NOT EXISTS public.parent_category
-(
-    id_parent_category integer NOT NULL GENERATED ALWAYS AS IDENTITY ( INCREMENT 1 START 1 MINVALUE 1 MAXVALUE 2147483647 CACHE 1 ),
-    name text COLLATE pg_catalog."default" NOT NULL,
-    CONSTRAINT parent_category_pkey PRIMARY KEY (id_parent_category),
-    CONSTRAINT unique_id UNIQUE (id_parent_category),
-    CONSTRAINT unique_name UNIQUE (name)
-);
-  
-CREATE TABLE IF NOT EXISTS public.categories_parent_category
-(
-    id_categories_parent_category integer NOT NULL GENERATED ALWAYS AS IDENTITY ( INCREMENT 1 START 1 MINVALUE 1 MAXVALUE 2147483647 CACHE 1 ),
-    id_categories integer NOT NULL,
-    id_parent_categories integer NOT NULL,
-    CONSTRAINT categories_parent_category_pkey PRIMARY KEY (id_categories_parent_category),
-    CONSTRAINT id_cetegories FOREIGN KEY (id_categories)
-        REFERENCES public.categories (id_categories) MATCH SIMPLE
-        ON UPDATE CASCADE
-        ON DELETE CASCADE,
-    CONSTRAINT id_parent_category FOREIGN KEY (id_parent_categories)
-        REFERENCES public.parent_category (id_parent_category) MATCH SIMPLE
-        ON UPDATE CASCADE
-        ON DELETE CASCADE
-);
- 
-CREATE TABLE IF NOT EXISTS public.product
-(
-    id_product integer NOT NULL GENERATED ALWAYS AS IDENTITY ( INCREMENT 1 START 1 MINVALUE 1 MAXVALUE 2147483647 CACHE 1 ),
-    name text COLLATE pg_catalog."default" NOT NULL,
-    id_image integer NOT NULL,
-    id_category integer NOT NULL,
-    description text COLLATE pg_catalog."default" NOT NULL,
-    amount bigint NOT NULL DEFAULT nextval('product_amount_seq'::regclass),
-    price money NOT NULL,
-    CONSTRAINT product_pkey PRIMARY KEY (id_product),
-    CONSTRAINT categories_parent_categories FOREIGN KEY (id_category)
-        REFERENCES public.categories_parent_category (id_categories_parent_category) MATCH SIMPLE
-        ON UPDATE CASCADE
-        ON DELETE CASCADE,
-    CONSTRAINT image FOREIGN KEY (id_image)
-        REFERENCES public.image (id_image) MATCH SIMPLE
-        ON UPDATE CASCADE
-        ON DELETE CASCADE
-);
-
-CREATE TABLE IF NOT EXISTS public.image
-(
-    id_image integer NOT NULL GENERATED ALWAYS AS IDENTITY ( INCREMENT 1 START 1 MINVALUE 1 MAXVALUE 2147483647 CACHE 1 ),
-    url bytea,
-    CONSTRAINT image_pkey PRIMARY KEY (id_image)
-);
-
-CREATE TABLE IF NOT EXISTS public."order"
-(
-    id_order integer NOT NULL GENERATED ALWAYS AS IDENTITY ( INCREMENT 1 START 1 MINVALUE 1 MAXVALUE 2147483647 CACHE 1 ),
-    order_date date NOT NULL,
-    CONSTRAINT order_pkey PRIMARY KEY (id_order)
-);
-
-CREATE TABLE IF NOT EXISTS public.order_details
-(
-    id_product_order integer NOT NULL GENERATED ALWAYS AS IDENTITY ( INCREMENT 1 START 1 MINVALUE 1 MAXVALUE 2147483647 CACHE 1 ),
-    id_product integer NOT NULL,
-    id_order integer NOT NULL,
-    amount integer NOT NULL,
-    price money NOT NULL,
-    CONSTRAINT product_order_pkey PRIMARY KEY (id_product_order),
-    CONSTRAINT "order" FOREIGN KEY (id_order)
-        REFERENCES public."order" (id_order) MATCH SIMPLE
-        ON UPDATE CASCADE
-        ON DELETE CASCADE
-        NOT VALID,
-    CONSTRAINT product FOREIGN KEY (id_product)
-        REFERENCES public.product (id_product) MATCH SIMPLE
-        ON UPDATE CASCADE
-        ON DELETE CASCADE
-        NOT VALID
-);
-    """
-
-connection = psycopg2.connect(**db)
-cursor = connection.cursor()
-cursor.execute(create_table_query)
-connection.commit()
+
+
+POOL_MAX_CONNECTIONS = 8
+POOL_CHECKOUT_TIMEOUT = 30
+HEALTH_CHECK_INTERVAL = 60
+
+
+class PoolError(psycopg2.Error):
+    pass
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.last_used = time.monotonic()
+        self.backend_pid = self.info.backend_pid
+        self.prepared_statements = set()
+        self.cursor_factory = InstrumentedCursor
+
+
+class ConnectionPool:
+    def __init__(self, max_connections, **params):
+        self.max_connections = max_connections
+        self._params = params
+        self._idle = []
+        self._size = 0
+        self._backend_pids = set()
+        self._condition = threading.Condition()
+
+    def getconn(self, timeout=POOL_CHECKOUT_TIMEOUT):
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._condition:
+                while not self._idle and self._size >= self.max_connections:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not self._condition.wait(remaining):
+                        raise PoolError('Нет свободных соединений с базой данных')
+                if self._idle:
+                    conn = self._idle.pop()
+                else:
+                    self._size += 1
+                    conn = None
+
+            if conn is None:
+                try:
+                    conn = psycopg2.connect(connection_factory=PooledConnection, **self._params)
+                except Exception:
+                    self._forget()
+                    raise
+                with self._condition:
+                    self._backend_pids.add(conn.backend_pid)
+                return conn
+
+            if self._is_healthy(conn):
+                return conn
+            self._close(conn)
+
+    def putconn(self, conn, discard=False):
+        if not discard and not conn.closed:
+            try:
+                if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+
+        if discard or conn.closed:
+            self._close(conn)
+            return
+
+        conn.last_used = time.monotonic()
+        with self._condition:
+            self._idle.append(conn)
+            self._condition.notify()
+
+    def backend_pids(self):
+        with self._condition:
+            return set(self._backend_pids)
+
+    def closeall(self):
+        with self._condition:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._close(conn)
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        if time.monotonic() - conn.last_used < HEALTH_CHECK_INTERVAL:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+        self._forget(conn.backend_pid)
+
+    def _forget(self, backend_pid=None):
+        with self._condition:
+            self._size -= 1
+            self._backend_pids.discard(backend_pid)
+            self._condition.notify()
+
+
+pool = ConnectionPool(POOL_MAX_CONNECTIONS, **db)
+_local = threading.local()
+
+
+@contextmanager
+def get_connection():
+    connection = getattr(_local, 'connection', None)
+    if connection is not None:
+        yield connection
+        return
+
+    connection = pool.getconn()
+    _local.connection = connection
+    discard = False
+    try:
+        yield connection
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        discard = True
+        raise
+    finally:
+        _local.connection = None
+        pool.putconn(connection, discard)
@@ -1,16 +1,136 @@
-from database import connection
+import re
+
+from database import get_connection
+from name_cache import NameCache
+from prepared import PreparedStatementRegistry
+
+category_id_cache = NameCache()
+parent_category_id_cache = NameCache()
+product_id_cache = NameCache()
+
+statements = PreparedStatementRegistry()
+statements.register('get_category_id', 'SELECT id_categories FROM categories WHERE name_categories = $1', ('text',))
+statements.register('get_product_id', 'SELECT id_product FROM product WHERE name = $1', ('text',))
+statements.register('get_order_quantity', '''
+    SELECT amount
+    FROM order_details
+    WHERE id_order = $1 AND id_product = $2
+''', ('integer', 'integer'))
+
+products_query = '''
+    SELECT P.id_product, P.name, P.id_image, C.name_categories, PC.name, P.description, P.amount, P.price
+    FROM product P
+    JOIN categories_parent_category CPC ON P.id_category = CPC.id_categories_parent_category
+    JOIN parent_category PC ON CPC.id_parent_categories = PC.id_parent_category
+    JOIN categories C ON CPC.id_categories = C.id_categories
+'''
+
+orders_query = '''
+    SELECT O.id_order, O.order_date, O.status
+    FROM "order" O
+'''
+
+category_pairs_query = '''
+    SELECT C.name_categories, PC.name
+    FROM categories_parent_category CPC
+    JOIN categories C ON CPC.id_categories = C.id_categories
+    JOIN parent_category PC ON CPC.id_parent_categories = PC.id_parent_category
+'''
+
+PAGE_SIZE = 200
+EXACT_COUNT_LIMIT = 10000
+# Порядок "C" совпадает с порядком строк в Python, поэтому ключ последней строки можно сравнивать на клиенте.
+product_page_key = 'P.name COLLATE "C", P.id_product'
+order_page_key = 'O.id_order'
+
+SEARCH_LIMIT = 100
+# Порог word_similarity из pg_trgm: чем ниже, тем больше опечаток прощается и тем больше лишних совпадений.
+SEARCH_SIMILARITY_THRESHOLD = 0.3
+
+# Оба условия отбора (<% и ILIKE) используют триграммные GIN-индексы, поэтому поиск не читает всю таблицу.
+search_products_query = '''
+    WITH matches AS (
+        SELECT P.id_product, word_similarity(%(text)s, P.name) AS score
+        FROM product P
+        WHERE %(text)s <%% P.name OR P.name ILIKE %(pattern)s
+        UNION ALL
+        SELECT P.id_product, word_similarity(%(text)s, C.name_categories)
+        FROM categories C
+        JOIN categories_parent_category CPC ON CPC.id_categories = C.id_categories
+        JOIN product P ON P.id_category = CPC.id_categories_parent_category
+        WHERE %(text)s <%% C.name_categories OR C.name_categories ILIKE %(pattern)s
+    )
+    SELECT id_product, max(score) AS score
+    FROM matches
+    GROUP BY id_product
+    ORDER BY score DESC, id_product
+    LIMIT %(limit)s;
+'''
+
+# Вес A у названия и B у описания: совпадение в названии поднимает товар выше.
+fulltext_search_query = '''
+    SELECT P.id_product, ts_rank_cd(P.search_vector, Q.query) AS score
+    FROM product P, (SELECT {query}) AS Q(query)
+    WHERE P.search_vector @@ Q.query
+    ORDER BY score DESC, P.id_product
+    LIMIT %s;
+'''
+
+
+def where_clause(conditions):
+    return ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+
+
+def count_rows(cursor, query, params):
+    # Для больших выборок точный count(*) дороже самой страницы, поэтому берётся оценка планировщика.
+    cursor.execute('EXPLAIN (FORMAT JSON) ' + query, params)
+    estimate = cursor.fetchone()[0][0]['Plan']['Plan Rows']
+    if estimate > EXACT_COUNT_LIMIT:
+        return estimate, False
+    cursor.execute(f'SELECT count(*) FROM ({query}) AS Q;', params)
+    return cursor.fetchone()[0], True
+
+
+def page_query(query, key, conditions=(), after=False):
+    # after - продолжение с ключа последней строки предыдущей страницы, он передаётся параметром перед LIMIT.
+    if after:
+        conditions = list(conditions) + [f'({key}) > %s']
+    return query + where_clause(conditions) + f' ORDER BY {key} LIMIT %s;'
+
+
+def fetch_page(query, key, after, limit, conditions=(), params=(), count=True):
+    page_params = list(params)
+    if after is not None:
+        page_params.append(tuple(after))
+    with get_connection() as connection, connection.cursor() as cursor:
+        cursor.execute(page_query(query, key, conditions, after is not None), page_params + [limit])
+        records = cursor.fetchall()
+        # Общее число строк считается только вместе с первой страницей.
+        total = None
+        if count and after is None:
+            total = count_rows(cursor, query + where_clause(conditions), list(params))
+    return records, total
+
+
+def get_name_cache_stats():
+    return {
+        'category': category_id_cache.stats(),
+        'parent_category': parent_category_id_cache.stats(),
+        'product': product_id_cache.stats(),
+    }
 
 
 def get_category_id(categories_name):
+    categories_id = category_id_cache.get(categories_name)
+    if categories_id is not None:
+        return categories_id
+    generation = category_id_cache.generation
     try:
-        with connection.cursor() as cursor:
-            cursor.execute('''
-                SELECT id_categories 
-                FROM categories 
-                WHERE name_categories = %s;
-                ''', (categories_name,))
+        with get_connection() as connection, connection.cursor() as cursor:
+            statements.execute(cursor, 'get_category_id', (categories_name,))
             result = cursor.fetchone()
             if result:
+                category_id_cache.put(categories_name, result[0], generation)
                 return result[0]
             else:
                 return None
@@ -19,16 +139,24 @@ def get_category_id(categories_name):
         return None
 
 
+parent_category_id_query = '''
+    SELECT id_parent_category 
+    FROM parent_category 
+    WHERE name = %s;
+'''
+
+
 def get_parent_category_id(parent_category_name):
+    parent_category_id = parent_category_id_cache.get(parent_category_name)
+    if parent_category_id is not None:
+        return parent_category_id
+    generation = parent_category_id_cache.generation
     try:
-        with connection.cursor() as cursor:
-            cursor.execute('''
-                SELECT id_parent_category 
-                FROM parent_category 
-                WHERE name = %s;
-                ''', (parent_category_name,))
+        with get_connection() as connection, connection.cursor() as cursor:
+            cursor.execute(parent_category_id_query, (parent_category_name,))
             result = cursor.fetchone()
             if result:
+                parent_category_id_cache.put(parent_category_name, result[0], generation)
                 return result[0]
             else:
                 return None
@@ -38,15 +166,16 @@ def get_parent_category_id(parent_category_name):
 
 
 def get_product_id(product_name):
+    product_id = product_id_cache.get(product_name)
+    if product_id is not None:
+        return product_id
+    generation = product_id_cache.generation
     try:
-        with connection.cursor() as cursor:
-            cursor.execute('''
-                SELECT id_product 
-                FROM product 
-                WHERE name = %s;
-                ''', (product_name,))
+        with get_connection() as connection, connection.cursor() as cursor:
+            statements.execute(cursor, 'get_product_id', (product_name,))
             result = cursor.fetchone()
             if result:
+                product_id_cache.put(product_name, result[0], generation)
                 return result[0]
             else:
                 return None
@@ -55,15 +184,51 @@ def get_product_id(product_name):
         return None
 
 
+product_facts_query = '''
+    SELECT P.id_product, P.name, P.amount, P.price, P.id_category, C.name_categories
+    FROM product P
+    JOIN categories_parent_category CPC ON P.id_category = CPC.id_categories_parent_category
+    JOIN categories C ON CPC.id_categories = C.id_categories
+'''
+
+products_facts_by_names_query = product_facts_query + '''
+    WHERE P.name = ANY(%s);
+'''
+
+
+def _product_facts(records):
+    return [{
+        'id_product': record[0],
+        'name': record[1],
+        'amount': record[2],
+        'price': record[3],
+        'id_category': record[4],
+        'category': record[5],
+    } for record in records]
+
+
+def get_products_facts_by_names(product_names):
+    generation = product_id_cache.generation
+    with get_connection() as connection, connection.cursor() as cursor:
+        cursor.execute(products_facts_by_names_query, (list(set(product_names)),))
+        products = {facts['name']: facts for facts in _product_facts(cursor.fetchall())}
+    for product_name, facts in products.items():
+        product_id_cache.put(product_name, facts['id_product'], generation)
+    return products
+
+
+image_for_product_query = '''
+    SELECT COALESCE(I.thumbnail_large, I.url)
+    FROM product P
+    JOIN image I ON P.id_image = I.id_image
+    WHERE P.name = %s;
+'''
+
+
 def get_image_for_product(name_product):
     try:
-        with connection.cursor() as cursor:
-            cursor.execute('''
-                SELECT I.url
-                FROM product P
-                JOIN image I ON P.id_image = I.id_image
-                WHERE P.name LIKE %s::text;
-            ''', (name_product,))
+        with get_connection() as connection, connection.cursor() as cursor:
+            cursor.execute(image_for_product_query, (name_product,))
 
             image_url = cursor.fetchone()
 
@@ -75,39 +240,43 @@ def get_image_for_product(name_product):
         return None
 
 
-def get_product_price(product_id):
-    with connection.cursor() as cursor:
-        cursor.execute('SELECT price FROM product WHERE id_product = %s;', (product_id,))
-        price = cursor.fetchone()[0]
-    return price
+def get_category_names():
+    with get_connection() as connection, connection.cursor() as cursor:
+        cursor.execute('''
+            SELECT name_categories 
+            FROM categories 
+            ORDER BY name_categories;
+        ''')
+        return [record[0] for record in cursor.fetchall()]
 
 
-def get_product_quantity(product_id):
-    with connection.cursor() as cursor:
-        cursor.execute('SELECT amount FROM product WHERE id_product = %s;', (product_id,))
-        quantity = cursor.fetchone()[0]
-    return quantity
+def get_category_pairs(order_by='C.name_categories'):
+    with get_connection() as connection, connection.cursor() as cursor:
+        cursor.execute(category_pairs_query + f' ORDER BY {order_by};')
+        return cursor.fetchall()
 
 
 def get_order_quantity(order_id, product_id):
-    with connection.cursor() as cursor:
-        cursor.execute('SELECT amount FROM order_details WHERE id_order = %s AND id_product = %s',
-                       (order_id, product_id,))
+    with get_connection() as connection, connection.cursor() as cursor:
+        statements.execute(cursor, 'get_order_quantity', (order_id, product_id))
         quantity = cursor.fetchone()[0]
     return quantity
 
 
+order_details_query = '''
+    SELECT P.name, C.name_categories, OD.id_order, OD.amount, OD.price, SUM(OD.price) OVER () AS total
+    FROM order_details OD
+    INNER JOIN product P ON OD.id_product = P.id_product
+    INNER JOIN categories_parent_category CPC ON P.id_category = CPC.id_categories_parent_category
+    JOIN categories C ON CPC.id_categories = C.id_categories
+    WHERE OD.id_order = %s
+'''
+
+
 def get_order_details(id_order):
     try:
-        with connection.cursor() as cursor:
-            cursor.execute('''
-                SELECT P.name, C.name_categories, OD.id_order, OD.amount, OD.price
-                FROM order_details OD
-                INNER JOIN product P ON OD.id_product = P.id_product
-                INNER JOIN categories_parent_category CPC ON P.id_category = CPC.id_categories_parent_category
-                JOIN categories C ON CPC.id_categories = C.id_categories
-                WHERE OD.id_order = %s
-            ''', (id_order,))
+        with get_connection() as connection, connection.cursor() as cursor:
+            cursor.execute(order_details_query, (id_order,))
 
             order_details_data = cursor.fetchall()
             return order_details_data
@@ -116,14 +285,195 @@ def get_order_details(id_order):
         print(f'Ошибка: {e}')
 
 
-def get_categories_in_order(cursor, categories_id):
-    cursor.execute('''
+product_in_open_order_query = '''
+    SELECT EXISTS (
+        SELECT 1
+        FROM order_details
+        WHERE id_product = %s AND order_open
+    );
+'''
+
+
+def product_in_open_order(cursor, product_id):
+    cursor.execute(product_in_open_order_query, (product_id,))
+    return cursor.fetchone()[0]
+
+
+categories_in_open_order_query = '''
+    SELECT EXISTS (
         SELECT 1
-        FROM order_details OD
-        JOIN product P ON OD.id_product = P.id_product
-        JOIN categories_parent_category CPC ON P.id_category = CPC.id_categories_parent_category
-        WHERE CPC.id_categories = %s OR CPC.id_parent_categories = %s;
-    ''', (categories_id, categories_id))
-    return cursor.fetchone() is not None
+        FROM categories_parent_category CPC
+        JOIN product P ON P.id_category = CPC.id_categories_parent_category
+        JOIN order_details OD ON OD.id_product = P.id_product AND OD.order_open
+        WHERE CPC.id_categories = %s
+    ) OR EXISTS (
+        SELECT 1
+        FROM categories_parent_category CPC
+        JOIN product P ON P.id_category = CPC.id_categories_parent_category
+        JOIN order_details OD ON OD.id_product = P.id_product AND OD.order_open
+        WHERE CPC.id_parent_categories = %s
+    );
+'''
+
+
+def categories_in_open_order(cursor, categories_id):
+    cursor.execute(categories_in_open_order_query, (categories_id, categories_id))
+    return cursor.fetchone()[0]
+
+
+product_in_order_query = '''
+    SELECT EXISTS (
+        SELECT 1
+        FROM order_details
+        WHERE id_product = %s
+    );
+'''
+
+
+def product_in_order(cursor, product_id):
+    # Удаление товара каскадно удаляет строки заказов, поэтому проверяются и завершённые заказы.
+    cursor.execute(product_in_order_query, (product_id,))
+    return cursor.fetchone()[0]
+
+
+# Связи категории выбираются заранее в массив: иначе EXISTS с расчётом на первую строку
+# сканирует categories_parent_category целиком.
+categories_in_order_query = '''
+    SELECT EXISTS (
+        SELECT 1
+        FROM product P
+        JOIN order_details OD ON OD.id_product = P.id_product
+        WHERE P.id_category = ANY (ARRAY(
+            SELECT id_categories_parent_category
+            FROM categories_parent_category
+            WHERE id_categories = %s OR id_parent_categories = %s
+        ))
+    );
+'''
+
+
+def categories_in_order(cursor, categories_id):
+    cursor.execute(categories_in_order_query, (categories_id, categories_id))
+    return cursor.fetchone()[0]
+
+
+def like_pattern(text):
+    return '%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def search_products(search_text, limit=SEARCH_LIMIT, threshold=SEARCH_SIMILARITY_THRESHOLD):
+    with get_connection() as connection, connection.cursor() as cursor:
+        cursor.execute("SELECT set_config('pg_trgm.word_similarity_threshold', %s, true);", (str(threshold),))
+        cursor.execute(search_products_query, {'text': search_text, 'pattern': like_pattern(search_text),
+                                               'limit': limit})
+        return cursor.fetchall()
+
+
+def fulltext_query(search_text):
+    # "слова в кавычках" ищутся как фраза, слово* - по началу слова, остальные слова должны встретиться все.
+    parts = []
+    params = []
+    for phrase, word in re.findall(r'"([^"]*)"?|(\S+)', search_text):
+        if phrase.strip():
+            parts.append("phraseto_tsquery('russian', %s)")
+            params.append(phrase)
+        elif word.endswith('*'):
+            prefix = re.sub(r'\W', '', word)
+            if prefix:
+                parts.append("to_tsquery('russian', %s)")
+                params.append(prefix + ':*')
+        elif word:
+            parts.append("plainto_tsquery('russian', %s)")
+            params.append(word)
+    return ' && '.join(parts), params
+
+
+def search_products_fulltext(search_text, limit=SEARCH_LIMIT):
+    query, params = fulltext_query(search_text)
+    if not query:
+        return []
+    with get_connection() as connection, connection.cursor() as cursor:
+        cursor.execute(fulltext_search_query.format(query=query), params + [limit])
+        return cursor.fetchall()
+
+
+def get_products(after=None, limit=PAGE_SIZE):
+    # Общее число товаров приходит с первой страницей, остальные страницы его не пересчитывают.
+    return fetch_page(products_query, product_page_key, after, limit)
+
+
+products_by_ids_query = products_query + '''
+    WHERE P.id_product = ANY(%s);
+'''
+
+
+def get_products_by_ids(product_ids):
+    with get_connection() as connection, connection.cursor() as cursor:
+        cursor.execute(products_by_ids_query, (list(product_ids),))
+        return cursor.fetchall()
+
+
+written_products_query = '''
+    WITH P AS ({statement} RETURNING *)
+    SELECT P.id_product, P.name, P.id_image, C.name_categories, PC.name, P.description, P.amount, P.price
+    FROM P
+    JOIN categories_parent_category CPC ON P.id_category = CPC.id_categories_parent_category
+    JOIN parent_category PC ON CPC.id_parent_categories = PC.id_parent_category
+    JOIN categories C ON CPC.id_categories = C.id_categories;
+'''
+
+
+def write_products(cursor, statement, params):
+    # Изменённые строки сразу возвращаются в том же виде, что и строки products_query.
+    cursor.execute(written_products_query.format(statement=statement), params)
+    return cursor.fetchall()
+
+
+thumbnail_hashes_query = '''
+    SELECT id_image, thumbnail_hash
+    FROM image
+    WHERE id_image = ANY(%s);
+'''
+
+
+def get_thumbnail_hashes(image_ids):
+    with get_connection() as connection, connection.cursor() as cursor:
+        cursor.execute(thumbnail_hashes_query, (list(image_ids),))
+        return cursor.fetchall()
+
+
+thumbnails_query = '''
+    SELECT id_image, COALESCE(thumbnail_small, url), thumbnail_hash
+    FROM image
+    WHERE id_image = ANY(%s);
+'''
+
+
+def get_thumbnails(image_ids):
+    with get_connection() as connection, connection.cursor() as cursor:
+        cursor.execute(thumbnails_query, (list(image_ids),))
+        return cursor.fetchall()
+
+
+def get_orders(after=None, limit=PAGE_SIZE):
+    if after is None:
+        with get_connection() as connection, connection.cursor() as cursor:
+            cursor.execute('''
+                DELETE FROM "order" O
+                WHERE NOT EXISTS (SELECT 1 FROM order_details OD WHERE OD.id_order = O.id_order);
+            ''')
+            connection.commit()
+    return fetch_page(orders_query, order_page_key, after, limit)
+
+
+orders_by_ids_query = orders_query + '''
+    WHERE O.id_order = ANY(%s)
+      AND EXISTS (SELECT 1 FROM order_details OD WHERE OD.id_order = O.id_order)
+    ORDER BY O.id_order;
+'''
 
 
+def get_orders_by_ids(order_ids):
+    with get_connection() as connection, connection.cursor() as cursor:
+        cursor.execute(orders_by_ids_query, (list(order_ids),))
+        return cursor.fetchall()
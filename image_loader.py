@@ -0,0 +1,132 @@
+from PyQt5.QtCore import QObject, QRect, Qt, QTimer
+from PyQt5.QtGui import QPainter, QPixmap, QPixmapCache
+from PyQt5.QtWidgets import QApplication, QStyle, QStyledItemDelegate
+
+from thumbnails import THUMBNAIL_SMALL, decode_image
+from workers import QueryExecutor
+
+IMAGE_LOADER_THREADS = 2
+# Общий для всех таблиц предел QPixmapCache в килобайтах, должен вмещать хотя бы один экран миниатюр.
+IMAGE_CACHE_LIMIT_KB = 64 * 1024
+PREFETCH_ROWS = 10
+SCROLL_DELAY_MS = 50
+PLACEHOLDER_TEXT = 'Загрузка…'
+
+
+def image_cache_key(image_id):
+    return f'thumbnail:{image_id}'
+
+
+class ImageDelegate(QStyledItemDelegate):
+    # Рисует миниатюру из QPixmapCache; пока её нет, остаётся текст-заглушка из модели.
+    def __init__(self, loader, parent=None):
+        super().__init__(parent)
+        self.loader = loader
+
+    def paint(self, painter, option, index):
+        image_id = index.data(Qt.UserRole)
+        pixmap = QPixmapCache.find(image_cache_key(image_id)) if image_id is not None else None
+        if pixmap is None:
+            super().paint(painter, option, index)
+            if image_id is not None and image_id not in self.loader.failed:
+                self.loader.schedule()
+            return
+
+        self.initStyleOption(option, index)
+        option.text = ''
+        style = option.widget.style() if option.widget is not None else QApplication.style()
+        style.drawControl(QStyle.CE_ItemViewItem, option, painter, option.widget)
+
+        size = pixmap.size().scaled(option.rect.size(), Qt.KeepAspectRatio)
+        if size.width() > pixmap.width():
+            size = pixmap.size()
+        target = QRect(option.rect.topLeft(), size)
+        target.moveCenter(option.rect.center())
+        painter.save()
+        painter.setRenderHint(QPainter.SmoothPixmapTransform)
+        painter.drawPixmap(target, pixmap)
+        painter.restore()
+
+
+class LazyImageLoader(QObject):
+    def __init__(self, view, model, column, fetch, parent=None):
+        super().__init__(parent)
+        self.view = view
+        self.model = model
+        self.column = column
+        self.fetch = fetch
+        self.pending = set()
+        self.failed = set()
+        self.executor = QueryExecutor(IMAGE_LOADER_THREADS, self)
+        QPixmapCache.setCacheLimit(IMAGE_CACHE_LIMIT_KB)
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(SCROLL_DELAY_MS)
+        self._timer.timeout.connect(self.load_visible)
+
+        # Загрузку запускает первая отрисовка ячейки, для которой нет миниатюры в кеше.
+        self.delegate = ImageDelegate(self, view)
+        view.setItemDelegateForColumn(column, self.delegate)
+
+    def schedule(self):
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def visible_rows(self):
+        row_count = self.model.rowCount()
+        if row_count == 0 or not self.view.isVisible():
+            return range(0)
+        first = self.view.rowAt(0)
+        last = self.view.rowAt(self.view.viewport().height() - 1)
+        first = 0 if first < 0 else first
+        last = row_count - 1 if last < 0 else last
+        return range(max(first - PREFETCH_ROWS, 0), min(last + PREFETCH_ROWS + 1, row_count))
+
+    def load_visible(self):
+        image_ids = set()
+        for row in self.visible_rows():
+            image_id = self.model.index(row, self.column).data(Qt.UserRole)
+            if image_id is None or image_id in self.failed or QPixmapCache.find(image_cache_key(image_id)):
+                continue
+            image_ids.add(image_id)
+
+        if not image_ids:
+            self.cancel()
+        elif not image_ids <= self.pending:
+            # Новый запрос вытесняет прежний: строки, ушедшие из видимой области, не загружаются.
+            self.pending = image_ids
+            self.executor.submit('images', self.load, list(image_ids), on_result=self.show_images,
+                                 on_error=self.load_failed)
+
+    def load(self, image_ids):
+        # Выполняется в пуле потоков загрузчика, в GUI-поток попадают уже готовые QImage.
+        # Для изображений без данных возвращается None, чтобы они не запрашивались при каждой отрисовке.
+        images = dict(self.fetch(image_ids))
+        return [(id_image, decode_image(images[id_image], THUMBNAIL_SMALL) if id_image in images else None)
+                for id_image in image_ids]
+
+    def show_images(self, records):
+        self.pending = set()
+        for id_image, image in records:
+            # Нечитаемое или не помещающееся в кеш изображение больше не запрашивается.
+            if image is None or not QPixmapCache.insert(image_cache_key(id_image), QPixmap.fromImage(image)):
+                self.failed.add(id_image)
+        self.view.viewport().update()
+
+    def load_failed(self, error):
+        self.pending = set()
+        print(f'Ошибка: {error}')
+
+    def reload(self, image_ids):
+        for image_id in image_ids:
+            QPixmapCache.remove(image_cache_key(image_id))
+            self.failed.discard(image_id)
+        self.view.viewport().update()
+
+    def cancel(self):
+        self.pending = set()
+        self.executor.cancel('images')
+
+    def shutdown(self):
+        self.executor.shutdown()
@@ -0,0 +1,193 @@
+import hashlib
+import os
+import sys
+
+import psycopg2
+from PyQt5.QtGui import QGuiApplication
+
+from database import get_connection
+from thumbnails import decode_image, encode_image, make_thumbnails
+
+# 'large_object' - оригиналы в больших объектах PostgreSQL, 'bytea' - в столбце image.url.
+IMAGE_STORAGE = 'large_object'
+IMAGE_NORMALIZE = True
+IMAGE_MAX_SIZE = 1600
+IMAGE_JPEG_QUALITY = 85
+IMAGE_CHUNK_SIZE = 256 * 1024
+IMAGE_GC_BATCH_SIZE = 100
+BACKFILL_BATCH_SIZE = 50
+
+store_image_query = '''
+    INSERT INTO image (content_hash, original_size, stored_size)
+    VALUES (%s, %s, %s)
+    ON CONFLICT (content_hash) DO UPDATE SET ref_count = image.ref_count
+    RETURNING id_image, xmax = 0;
+'''
+
+collect_unused_images_query = '''
+    DELETE FROM image
+    WHERE id_image IN (
+        SELECT id_image
+        FROM image I
+        WHERE ref_count = 0
+          AND NOT EXISTS (SELECT 1 FROM product P WHERE P.id_image = I.id_image)
+        ORDER BY id_image
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    ) AND ref_count = 0;
+'''
+
+
+def iter_source_chunks(source, chunk_size=IMAGE_CHUNK_SIZE):
+    # source - путь к файлу или байты изображения.
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                yield chunk
+    else:
+        for offset in range(0, len(source), chunk_size):
+            yield source[offset:offset + chunk_size]
+
+
+def hash_image(source):
+    content_hash = hashlib.sha256()
+    for chunk in iter_source_chunks(source):
+        content_hash.update(chunk)
+    return content_hash.hexdigest()
+
+
+def upload_large_object(connection, source):
+    large_object = connection.lobject(0, 'wb')
+    try:
+        for chunk in iter_source_chunks(source):
+            large_object.write(chunk)
+        return large_object.oid
+    finally:
+        large_object.close()
+
+
+def normalize_image(path):
+    # Повторное кодирование ограничивает размеры, применяет поворот из EXIF и отбрасывает метаданные.
+    image = decode_image(path, IMAGE_MAX_SIZE)
+    if image is None:
+        raise ValueError('Не удалось прочитать изображение')
+    if image.hasAlphaChannel():
+        return encode_image(image, 'PNG')
+    return encode_image(image, 'JPG', IMAGE_JPEG_QUALITY)
+
+
+def store_image(cursor, path, storage=IMAGE_STORAGE, normalize=IMAGE_NORMALIZE):
+    original_size = os.path.getsize(path)
+    source = normalize_image(path) if normalize else path
+    stored_size = len(source) if normalize else original_size
+
+    content_hash = hash_image(source)
+    # ON CONFLICT DO UPDATE блокирует уже сохранённую строку до конца транзакции, поэтому
+    # collect_unused_images не удалит её, пока вызывающий не сошлётся на неё из product.
+    cursor.execute(store_image_query, (content_hash, original_size, stored_size))
+    id_image, created = cursor.fetchone()
+    if not created:
+        return id_image
+
+    thumbnail_small, thumbnail_large = make_thumbnails(source)
+    if storage == 'large_object':
+        url, url_oid = None, upload_large_object(cursor.connection, source)
+    else:
+        url, url_oid = psycopg2.Binary(b''.join(iter_source_chunks(source))), None
+
+    cursor.execute('''
+        UPDATE image
+        SET url = %s, url_oid = %s, thumbnail_small = %s, thumbnail_large = %s, thumbnail_failed = %s
+        WHERE id_image = %s;
+    ''', (url, url_oid, thumbnail_small, thumbnail_large, thumbnail_small is None, id_image))
+    return id_image
+
+
+def iter_image_chunks(cursor, id_image, chunk_size=IMAGE_CHUNK_SIZE):
+    cursor.execute('''
+        SELECT url_oid, octet_length(url)
+        FROM image
+        WHERE id_image = %s;
+    ''', (id_image,))
+    image = cursor.fetchone()
+    if image is None:
+        return
+    url_oid, size = image
+
+    if url_oid is not None:
+        large_object = cursor.connection.lobject(url_oid, 'rb')
+        try:
+            for chunk in iter(lambda: large_object.read(chunk_size), b''):
+                yield chunk
+        finally:
+            large_object.close()
+        return
+
+    for offset in range(0, size or 0, chunk_size):
+        cursor.execute('''
+            SELECT substring(url FROM %s FOR %s)
+            FROM image
+            WHERE id_image = %s;
+        ''', (offset + 1, chunk_size, id_image))
+        yield bytes(cursor.fetchone()[0])
+
+
+def read_image(cursor, id_image):
+    return b''.join(iter_image_chunks(cursor, id_image))
+
+
+def export_image(id_image, path):
+    with get_connection() as connection, connection.cursor() as cursor, open(path, 'wb') as f:
+        for chunk in iter_image_chunks(cursor, id_image):
+            f.write(chunk)
+
+
+def collect_unused_images(batch_size=IMAGE_GC_BATCH_SIZE):
+    removed = 0
+    while True:
+        with get_connection() as connection, connection.cursor() as cursor:
+            # Внешний ключ product.id_image каскадный, поэтому ошибка в ref_count не должна удалять товары.
+            cursor.execute(collect_unused_images_query, (batch_size,))
+            deleted = cursor.rowcount
+            connection.commit()
+        removed += deleted
+        if deleted < batch_size:
+            return removed
+
+
+def backfill_thumbnails(batch_size=BACKFILL_BATCH_SIZE):
+    last_id = 0
+    done = 0
+    while True:
+        with get_connection() as connection, connection.cursor() as cursor:
+            cursor.execute('''
+                SELECT id_image
+                FROM image
+                WHERE id_image > %s AND (url IS NOT NULL OR url_oid IS NOT NULL)
+                  AND (thumbnail_small IS NULL OR thumbnail_large IS NULL) AND NOT thumbnail_failed
+                ORDER BY id_image
+                LIMIT %s;
+            ''', (last_id, batch_size))
+            image_ids = [row[0] for row in cursor.fetchall()]
+            if not image_ids:
+                return done
+
+            # Оригиналы читаются по одному, в памяти не больше одного изображения.
+            for id_image in image_ids:
+                small, large = make_thumbnails(read_image(cursor, id_image))
+                # Нечитаемое изображение остаётся без миниатюр и показывается в исходном виде;
+                # отметка thumbnail_failed исключает его из следующих запусков.
+                cursor.execute('''
+                    UPDATE image
+                    SET thumbnail_small = %s, thumbnail_large = %s, thumbnail_failed = %s
+                    WHERE id_image = %s;
+                ''', (small, large, small is None, id_image))
+                if small is not None:
+                    done += 1
+            connection.commit()
+        last_id = image_ids[-1]
+
+
+if __name__ == '__main__':
+    app = QGuiApplication(sys.argv)
+    print(f'Миниатюр создано: {backfill_thumbnails()}')
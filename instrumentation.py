@@ -0,0 +1,205 @@
+import logging
+import re
+import sys
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+
+import psycopg2
+import psycopg2.extensions
+
+SLOW_QUERY_THRESHOLD_MS = 200
+SLOW_QUERY_LOG = 'slow_queries.log'
+SLOW_QUERY_LOG_MAX_BYTES = 5 * 1024 * 1024
+SLOW_QUERY_LOG_BACKUPS = 3
+EXPLAIN_SLOW_QUERIES = True
+
+EXPLAINED_STATEMENTS = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'EXECUTE')
+SKIPPED_MODULES = ('instrumentation', 'prepared', 'contextlib')
+
+slow_query_logger = logging.getLogger('slow_queries')
+slow_query_logger.propagate = False
+
+query_stats = {}
+_stats_lock = threading.Lock()
+_placeholder = re.compile(r'%%|%\((\w+)\)s|%s')
+# Строки, идентификаторы в кавычках, $тег$-строки и комментарии, в которых точка с запятой ничего не разделяет.
+_quoted = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|(\$(?:[A-Za-z_]\w*)?\$).*?\1|--[^\n]*|/\*.*?\*/", re.S)
+
+
+def configure_slow_query_log(path=SLOW_QUERY_LOG, max_bytes=SLOW_QUERY_LOG_MAX_BYTES,
+                             backup_count=SLOW_QUERY_LOG_BACKUPS):
+    for handler in list(slow_query_logger.handlers):
+        slow_query_logger.removeHandler(handler)
+        handler.close()
+    handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True)
+    handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+    slow_query_logger.addHandler(handler)
+    slow_query_logger.setLevel(logging.INFO)
+
+
+def get_query_stats():
+    with _stats_lock:
+        return {caller: dict(stats) for caller, stats in query_stats.items()}
+
+
+def reset_query_stats():
+    with _stats_lock:
+        query_stats.clear()
+
+
+def _caller():
+    frame = sys._getframe(2)
+    while frame is not None and frame.f_globals.get('__name__') in SKIPPED_MODULES:
+        frame = frame.f_back
+    return frame.f_code.co_name if frame is not None else '?'
+
+
+def _record(caller, duration=0.0, rows=0, size=0, calls=0):
+    with _stats_lock:
+        stats = query_stats.setdefault(caller, {'calls': 0, 'time': 0.0, 'max_time': 0.0, 'rows': 0, 'bytes': 0})
+        stats['calls'] += calls
+        stats['time'] += duration
+        stats['max_time'] = max(stats['max_time'], duration)
+        stats['rows'] += max(rows, 0)
+        stats['bytes'] += size
+
+
+def _elide_binary(vars, replacement):
+    # Изображения в параметрах (bytea) занимают мегабайты, в журнал и в EXPLAIN попадает только их размер.
+    def elide(value):
+        if isinstance(value, psycopg2.extensions.Binary):
+            value = value.adapted
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return replacement(len(value))
+        return value
+
+    if isinstance(vars, dict):
+        return {name: elide(value) for name, value in vars.items()}
+    if vars is not None:
+        return [elide(value) for value in vars]
+    return None
+
+
+def _parameterised(query):
+    # %s и %(name)s -> $1, $2, ...: EXPLAIN (GENERIC_PLAN) строит план без значений параметров.
+    numbers = {}
+
+    def number(match):
+        if match.group(0) == '%%':
+            return '%'
+        name = match.group(1) if match.group(1) is not None else len(numbers)
+        numbers.setdefault(name, len(numbers) + 1)
+        return f'${numbers[name]}'
+
+    return _placeholder.sub(number, query)
+
+
+def _single_statement(query):
+    # Точка с запятой вне строк и комментариев начинает следующий запрос, и EXPLAIN выполнил бы его по-настоящему.
+    return ';' not in _quoted.sub(' ', query).rstrip().rstrip(';')
+
+
+def _row_size(row):
+    size = 0
+    for value in row:
+        if isinstance(value, (bytes, bytearray, memoryview, str)):
+            size += len(value)
+        elif value is not None:
+            size += 8
+    return size
+
+
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    caller = '?'
+
+    def execute(self, query, vars=None):
+        self.caller = _caller()
+        started = time.perf_counter()
+        try:
+            result = super().execute(query, vars)
+        except psycopg2.Error as e:
+            slow_query_logger.error('%s: %s\n%s', self.caller, str(e).strip(), self._logged_statement(query, vars))
+            raise
+
+        duration = time.perf_counter() - started
+        _record(self.caller, duration, self.rowcount, calls=1)
+        if duration * 1000 >= SLOW_QUERY_THRESHOLD_MS:
+            self._log_slow_query(query, vars, duration)
+        return result
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            _record(self.caller, size=_row_size(row))
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        _record(self.caller, size=sum(_row_size(row) for row in rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        _record(self.caller, size=sum(_row_size(row) for row in rows))
+        return rows
+
+    def _statement(self, query, vars):
+        try:
+            statement = self.mogrify(query, vars)
+        except (psycopg2.Error, TypeError, KeyError, IndexError):
+            statement = query
+        if isinstance(statement, bytes):
+            encoding = psycopg2.extensions.encodings.get(self.connection.encoding, 'utf-8')
+            statement = statement.decode(encoding, 'replace')
+        return statement.strip()
+
+    def _logged_statement(self, query, vars):
+        return self._statement(query, _elide_binary(vars, lambda size: f'<bytea {size} байт>'))
+
+    def _log_slow_query(self, query, vars, duration):
+        statement = self._logged_statement(query, vars)
+        plan = self._explain(query, vars) if EXPLAIN_SLOW_QUERIES else None
+        message = f'{self.caller}: {duration * 1000:.1f} ms, {self.rowcount} rows\n{statement}'
+        if plan:
+            message += '\n' + plan
+        slow_query_logger.warning(message)
+
+    def _explain(self, query, vars):
+        # Запрос не выполняется повторно (без ANALYZE): SELECT и WITH тоже могут изменять данные.
+        if not isinstance(query, str):
+            return None
+        keyword = query.split(None, 1)[0].upper() if query.strip() else ''
+        if keyword not in EXPLAINED_STATEMENTS:
+            return None
+        if vars and keyword != 'EXECUTE' and self.connection.server_version >= 160000:
+            explain = 'EXPLAIN (GENERIC_PLAN) '
+            statement = _parameterised(query).strip()
+        else:
+            # До PostgreSQL 16 значения подставляются, но вместо bytea уходит NULL.
+            explain = 'EXPLAIN '
+            statement = self._statement(query, _elide_binary(vars, lambda size: None))
+        if not _single_statement(statement):
+            return None
+
+        status = self.connection.info.transaction_status
+        if status == psycopg2.extensions.TRANSACTION_STATUS_INERROR:
+            return None
+        in_transaction = status == psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+
+        with psycopg2.extensions.cursor(self.connection) as cursor:
+            try:
+                if in_transaction:
+                    cursor.execute('SAVEPOINT slow_query_explain')
+                cursor.execute(explain + statement)
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+                if in_transaction:
+                    cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+                return plan
+            except psycopg2.Error as e:
+                if in_transaction:
+                    cursor.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+                return f'EXPLAIN не выполнен: {str(e).strip()}'
+
+
+configure_slow_query_log()
@@ -1,26 +1,49 @@
-import psycopg2
 import base64
 import os
 import sys
 
-from database import connection
+from database import get_connection, pool
+from migrations import migrate
 from ui_main import Ui_MainWindow
 from qt_material import apply_stylesheet
 from datetime import datetime
+from decimal import Decimal
 from functools import partial
-from PyQt5.QtCore import QPropertyAnimation, QSize, QRegExp, Qt, QUrl, QStringListModel
-from PyQt5.QtGui import QStandardItemModel, QStandardItem, QIcon, QPixmap, QRegExpValidator, QPainter
+from PyQt5.QtCore import QPropertyAnimation, QRegExp, Qt, QUrl, QStringListModel, QTimer
+from PyQt5.QtGui import QIcon, QRegExpValidator, QPainter
 from PyQt5.QtPrintSupport import QPrinter, QPrintDialog
-from PyQt5.QtWidgets import QMainWindow, QApplication, QMessageBox, QPushButton, QHeaderView, QFileDialog, QLabel
-from get import get_category_id, get_parent_category_id, get_image_for_product, get_product_id, get_product_price, \
-    get_product_quantity, get_order_quantity, get_order_details, get_categories_in_order
+from PyQt5.QtWidgets import QMainWindow, QApplication, QMessageBox, QHeaderView, QFileDialog, QStyle
+from get import get_category_id, get_parent_category_id, get_image_for_product, get_product_id, \
+    get_order_quantity, get_order_details, get_category_names, get_category_pairs, categories_in_open_order, \
+    product_in_open_order, categories_in_order, product_in_order, get_products, get_orders, \
+    search_products, search_products_fulltext, get_products_by_ids, get_orders_by_ids, get_products_facts_by_names, category_id_cache, \
+    parent_category_id_cache, product_id_cache, write_products
+from catalog_store import ProductStore, CatalogProxyModel, CATALOG_COLUMNS, PRODUCT_COLUMNS
+from image_loader import LazyImageLoader
+from images import store_image, collect_unused_images, backfill_thumbnails
+from notifications import ChangeListener
+from thumbnail_store import load_thumbnails, revalidate_thumbnails, thumbnail_store
 from reports import product_quantity, generate_pdf, categories_parents, categories_count, order_count, \
-    product_quantity_date, create_pdf_report
+    product_quantity_date, create_pdf_report, format_price
+from table_model import RecordTableModel, PagedTableModel, action_icon, set_action_columns, is_action
+from workers import QueryExecutor
 
 directory = os.path.abspath(os.curdir)
 russian_validator = QRegExpValidator(QRegExp('[А-Яа-яЁё ]+'))
+# Кавычки задают фразу, звёздочка - поиск по началу слова.
+search_validator = QRegExpValidator(QRegExp('[А-Яа-яЁё0-9 "*-]+'))
 real = QRegExpValidator(QRegExp('^[0-9]+(\.[0-9]{1,2})?$'))
 integer = QRegExpValidator(QRegExp('^[0-9]+$'))
+order_statuses = {'open': 'Открыт', 'completed': 'Выполнен'}
+order_line_headers = ['Наименование', 'Категория', '', 'Количество', '', 'Цена']
+# Порядок совпадает с пунктами comboBoxSearchMode.
+search_modes = [search_products, search_products_fulltext]
+
+
+def search_catalog(search, search_text):
+    # Найденные товары загружаются сразу: хранилище может ещё не дойти до них постранично.
+    records = search(search_text)
+    return records, get_products_by_ids([id_product for id_product, _ in records])
 
 
 def show_error_message(message):
@@ -33,40 +56,85 @@ def show_error_message(message):
     msg.exec_()
 
 
-def update_product_amount(product_id, delta):
-    with connection.cursor() as cursor:
+def order_cells(record):
+    id_order, order_date, status = record
+    return ([str(id_order), str(order_date), order_statuses.get(status, status)],
+            [id_order, None, status, None, None, status == 'open'])
+
+
+def order_line_cells(product_name, category_name, amount, price):
+    return [product_name, category_name, None, amount, None, format_price(price)], [None] * 5 + [price]
+
+
+def order_row_key(texts, values):
+    return values[0],
+
+
+def complete_order(order_id):
+    with get_connection() as connection, connection.cursor() as cursor:
         cursor.execute('''
-            UPDATE product
-            SET amount = amount - %s
-            WHERE id_product = %s
-        ''', (delta, product_id))
+            UPDATE "order"
+            SET status = 'completed'
+            WHERE id_order = %s;
+        ''', (order_id,))
+        connection.commit()
+    return get_orders_by_ids([order_id])
 
-    connection.commit()
 
+def place_order(order_lines):
+    products = get_products_facts_by_names(product_name for product_name, _ in order_lines)
+    missing = [product_name for product_name, _ in order_lines if product_name not in products]
+    if missing:
+        raise ValueError(f'Товар не найден: {", ".join(missing)}')
 
-def delete_unused_images():
-    try:
-        with connection.cursor() as cursor:
-            cursor.execute('''
-                DELETE FROM image
-                WHERE id_image 
-                NOT IN (SELECT id_image FROM product);
+    amounts = {}
+    for product_name, amount in order_lines:
+        product_id = products[product_name]['id_product']
+        amounts[product_id] = amounts.get(product_id, 0) + amount
+    product_ids = list(amounts)
+    product_amounts = [amounts[product_id] for product_id in product_ids]
+
+    with get_connection() as connection, connection.cursor() as cursor:
+        cursor.execute('''
+            INSERT INTO "order" (order_date) 
+            VALUES (CURRENT_DATE) 
+            RETURNING id_order;
             ''')
+        new_order_id = cursor.fetchone()[0]
+
+        cursor.execute('''
+            UPDATE product P
+            SET amount = P.amount - L.amount
+            FROM unnest(%s::integer[], %s::integer[]) AS L(id_product, amount)
+            WHERE P.id_product = L.id_product
+            RETURNING P.id_product;
+        ''', (product_ids, product_amounts))
+        changed_ids = [row[0] for row in cursor.fetchall()]
+
+        cursor.execute('''
+            INSERT INTO order_details (id_order, id_product, amount, price)
+            SELECT %s, P.id_product, L.amount, P.price * L.amount
+            FROM unnest(%s::integer[], %s::integer[]) AS L(id_product, amount)
+            JOIN product P ON P.id_product = L.id_product
+            RETURNING id_product, price;
+        ''', (new_order_id, product_ids, product_amounts))
+        line_prices = dict(cursor.fetchall())
+
         connection.commit()
-    except Exception as e:
-        print(f'Ошибка: {e}')
+
+    names = {products[product_name]['id_product']: product_name for product_name, _ in order_lines}
+    order_pdf = [(names[product_id], product_id, amounts[product_id], line_prices[product_id])
+                 for product_id in product_ids]
+    # Уведомления собственных соединений не обрабатываются, поэтому остатки обновляются здесь.
+    return new_order_id, order_pdf, changed_ids, get_products_by_ids(changed_ids)
 
 
-def update_quantity(row, delta, model):
+def update_quantity(row, delta, model, product):
     try:
-        amount_item = model.item(row, 3)
-        amount_text = amount_item.text()
+        amount_text = model.text(row, 3)
         amount = int(amount_text) if amount_text else 0
-        product_name = model.item(row, 0).text()
-        product_id = get_product_id(product_name)
-        quantity = get_product_quantity(product_id)
-        price_text = get_product_price(product_id)
-        price = float(price_text.replace('$', '')) if price_text else 0.0
+        quantity = product['amount']
+        price = product['price']
 
         new_amount = max(amount + delta, 0)
 
@@ -74,15 +142,113 @@ def update_quantity(row, delta, model):
             show_error_message('На складе недостаточно товара для совершения заказа, пожалуйста попробуйте позже')
             return
 
-        amount_item.setText(str(new_amount))
-        total_price = new_amount * price
-        total_price_item = model.item(row, 5)
-        total_price_item.setText('${:.2f}'.format(total_price))
+        model.set_cell(row, 3, str(new_amount))
+        model.set_cell(row, 5, format_price(new_amount * price), new_amount * price)
 
     except Exception as e:
         print(f'Ошибка: {e}')
 
 
+def get_order_line_product(order_id, product_name):
+    product = get_products_facts_by_names([product_name])[product_name]
+    return product, get_order_quantity(order_id, product['id_product'])
+
+
+def save_order_lines(order_id, order_lines):
+    products = get_products_facts_by_names(product_name for product_name, _, _ in order_lines)
+    missing = [product_name for product_name, _, _ in order_lines if product_name not in products]
+    if missing:
+        raise ValueError(f'Товар не найден: {", ".join(missing)}')
+
+    product_ids = [products[product_name]['id_product'] for product_name, _, _ in order_lines]
+    amounts = [new_amount for _, new_amount, _ in order_lines]
+    prices = [price for _, _, price in order_lines]
+
+    with get_connection() as connection, connection.cursor() as cursor:
+        # Остаток меняется на разницу с прежним количеством, поэтому товары обновляются до строк заказа.
+        cursor.execute('''
+            UPDATE product P
+            SET amount = P.amount - (L.amount - OD.amount)
+            FROM unnest(%s::integer[], %s::integer[]) AS L(id_product, amount)
+            JOIN order_details OD ON OD.id_order = %s AND OD.id_product = L.id_product
+            WHERE P.id_product = L.id_product
+            RETURNING P.id_product;
+        ''', (product_ids, amounts, order_id))
+        changed_ids = [row[0] for row in cursor.fetchall()]
+
+        cursor.execute('''
+            UPDATE order_details OD
+            SET amount = L.amount, price = L.price
+            FROM unnest(%s::integer[], %s::integer[], %s::numeric[]) AS L(id_product, amount, price)
+            WHERE OD.id_order = %s AND OD.id_product = L.id_product;
+        ''', (product_ids, amounts, prices, order_id))
+
+        connection.commit()
+    return changed_ids, get_products_by_ids(changed_ids)
+
+
+def product_category_id(cursor, category_name, parent_category_name):
+    cursor.execute('''
+        SELECT CPC.id_categories_parent_category
+        FROM categories_parent_category CPC
+        JOIN categories C ON CPC.id_categories = C.id_categories
+        JOIN parent_category PC ON CPC.id_parent_categories = PC.id_parent_category
+        WHERE C.name_categories = %s AND PC.name = %s;
+    ''', (category_name, parent_category_name))
+    return cursor.fetchone()[0]
+
+
+def insert_product(name_product, image_file, category_name, parent_category_name, description_product,
+                   amount_product, price_product):
+    with get_connection() as connection, connection.cursor() as cursor:
+        cursor.execute('''
+                       SELECT id_product 
+                       FROM product 
+                       WHERE name = %s;
+                   ''', (name_product,))
+        if cursor.fetchone():
+            return None
+
+        id_image = store_image(cursor, image_file)
+        id_categories_parent_category = product_category_id(cursor, category_name, parent_category_name)
+
+        written_products = write_products(cursor, '''
+            INSERT INTO product (name, id_image, id_category, description, amount, price)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        ''', (name_product, id_image, id_categories_parent_category, description_product, amount_product,
+              price_product))
+        connection.commit()
+    return written_products
+
+
+def update_product(original_name_product, new_name_product, image_file, category_name, parent_category_name,
+                   description_product, amount_product, price_product):
+    id_product = get_product_id(original_name_product)
+    with get_connection() as connection, connection.cursor() as cursor:
+        if product_in_open_order(cursor, id_product):
+            return None
+
+        # Изображение может быть общим для нескольких товаров, поэтому не меняется на месте.
+        id_image = store_image(cursor, image_file) if image_file is not None else None
+        id_categories_parent_category = product_category_id(cursor, category_name, parent_category_name)
+
+        written_products = write_products(cursor, '''
+            UPDATE product
+            SET name = %s, id_image = COALESCE(%s, id_image), id_category = %s, description = %s, amount = %s, price = %s
+            WHERE id_product = %s
+        ''', (new_name_product, id_image, id_categories_parent_category, description_product, amount_product,
+              price_product, id_product))
+        connection.commit()
+    return id_product, written_products
+
+
+def find_product_row(model, product_name):
+    for row in range(model.rowCount()):
+        if model.text(row, 0) == product_name:
+            return row
+    return None
+
+
 class MainWindow(QMainWindow):
     def __init__(self):
         QMainWindow.__init__(self)
@@ -91,7 +257,6 @@ class MainWindow(QMainWindow):
         self.current_edit_parent_categories_id = None
         self.current_edit_categories_id = None
         self.vertical_header = None
-        self.horizontal_header = None
         self.header = None
         self.animation = None
         self.image_file = None
@@ -134,27 +299,72 @@ class MainWindow(QMainWindow):
 
         self.ui.textEditImageProduct.mousePressEvent = self.open_image_dialog
 
-        self.model_table_categories = QStandardItemModel()
+        self.model_table_categories = RecordTableModel(['Имя категории', 'Имя родительской категории', '', ''])
         self.ui.tableAddCategories.setModel(self.model_table_categories)
-        self.model_table_product = QStandardItemModel()
+        self.product_store = ProductStore(self)
+        self.model_table_product = CatalogProxyModel(self.product_store, CATALOG_COLUMNS, self)
         self.ui.tableProductOrder.setModel(self.model_table_product)
-        self.model_table_main_product = QStandardItemModel()
+        self.model_table_main_product = CatalogProxyModel(self.product_store, PRODUCT_COLUMNS, self)
         self.ui.tableProduct.setModel(self.model_table_main_product)
-        self.model_table_orders = QStandardItemModel()
+        for view in (self.ui.tableProductOrder, self.ui.tableProduct):
+            view.setSortingEnabled(True)
+            view.sortByColumn(0, Qt.AscendingOrder)
+        self.model_table_orders = RecordTableModel(order_line_headers)
         self.ui.tableCatalogOrder.setModel(self.model_table_orders)
-        self.model_table_main_orders = QStandardItemModel()
+        self.model_table_main_orders = PagedTableModel(['Номер заказа', 'Дата заказа', 'Статус', '', '', ''],
+                                                       order_cells, order_row_key)
         self.ui.listOrder.setModel(self.model_table_main_orders)
-        self.model_table_edit_order = QStandardItemModel()
+        self.model_table_edit_order = RecordTableModel(order_line_headers)
         self.ui.editOrder.setModel(self.model_table_edit_order)
         self.order_details_model = QStringListModel()
         self.ui.listOrders_2.setModel(self.order_details_model)
+        self.catalog_images = LazyImageLoader(self.ui.tableProductOrder, self.model_table_product, 1, load_thumbnails,
+                                              self)
+        self.product_images = LazyImageLoader(self.ui.tableProduct, self.model_table_main_product, 1, load_thumbnails,
+                                              self)
+
+        self.ui.tableProductOrder.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        set_action_columns(self.ui.tableProduct, {
+            6: (action_icon('edit'), self.edit_product),
+            7: (action_icon('delete'), self.delete_product)})
+        set_action_columns(self.ui.tableAddCategories, {
+            2: (action_icon('edit'), self.edit_categories),
+            3: (action_icon('delete'), self.delete_categories)})
+        set_action_columns(self.ui.listOrder, {
+            3: (action_icon('edit'), lambda row: self.edit_product_order()),
+            4: (action_icon('delete'), lambda row: self.delete_order()),
+            5: (self.style().standardIcon(QStyle.SP_DialogApplyButton),
+                lambda row: self.complete_order(self.model_table_main_orders.value(row, 0)), 40)})
+        set_action_columns(self.ui.tableCatalogOrder, {
+            2: (action_icon('plus'), lambda row: self.update_quantity(row, 1, self.model_table_orders)),
+            4: (action_icon('minus'), lambda row: self.update_quantity(row, -1, self.model_table_orders))})
+        set_action_columns(self.ui.editOrder, {
+            2: (action_icon('plus'), lambda row: self.update_quantity_2(row, 1, self.model_table_edit_order)),
+            4: (action_icon('minus'), lambda row: self.update_quantity_2(row, -1, self.model_table_edit_order))})
+
+        self.executor = QueryExecutor(parent=self)
+        self.executor.busy_changed.connect(self.set_busy)
+
+        self.changed_products = set()
+        self.changed_orders = set()
+        self.patching_products = set()
+        self.patching_orders = set()
+        self.categories_changed = False
+        self.changes_timer = QTimer(self)
+        self.changes_timer.setSingleShot(True)
+        self.changes_timer.setInterval(100)
+        self.changes_timer.timeout.connect(self.apply_data_changes)
+        self.listener = ChangeListener(parent=self)
+        self.listener.changed.connect(self.data_changed)
+        self.listener.reconnected.connect(self.reload_all)
+        self.listener.start()
+        self.executor.submit('thumbnails', backfill_thumbnails, on_result=self.revalidate_thumbnails)
 
-        self.filter_product()
-        self.get_data_main_product()
         self.get_categories_parent_category()
         self.get_categories_parent_category_2()
         self.get_data_categories()
         self.get_categories()
+        self.ui.comboBox_categories.currentIndexChanged.connect(self.selected_category_products)
         self.get_data_orders()
         self.get_data_product()
 
@@ -166,7 +376,7 @@ class MainWindow(QMainWindow):
         self.ui.lineEditParentCategory_2.setValidator(russian_validator)
         self.ui.lineEditNameProduct.setValidator(russian_validator)
         self.ui.lineEditNameProduct_2.setValidator(russian_validator)
-        self.ui.lineEditSearch.setValidator(russian_validator)
+        self.ui.lineEditSearch.setValidator(search_validator)
 
         self.ui.lineEditAmountProduct.setValidator(integer)
         self.ui.lineEditAmountProduct_2.setValidator(integer)
@@ -183,6 +393,7 @@ class MainWindow(QMainWindow):
 
         self.rows = []
         self.updates = []
+        self.quantity_deltas = {}
         self.order_lines = []
         self.report = ['Всего товаров в магазине',
                        'Вывод родительских категорий по категориям',
@@ -195,6 +406,81 @@ class MainWindow(QMainWindow):
         self.ui.comboBox.addItems(self.report)
         self.ui.comboBox.currentIndexChanged.connect(self.line_edit)
 
+    def data_changed(self, payload):
+        table = payload.get('table')
+        if table == 'product':
+            product_id_cache.invalidate(id_value=payload['id_product'])
+            self.changed_products.add(payload['id_product'])
+        elif table in ('order', 'order_details'):
+            self.changed_orders.add(payload['id_order'])
+        else:
+            if table == 'categories':
+                category_id_cache.invalidate(id_value=payload['id_categories'])
+            elif table == 'parent_category':
+                parent_category_id_cache.invalidate(id_value=payload['id_parent_category'])
+            self.categories_changed = True
+        self.changes_timer.start()
+
+    def apply_data_changes(self):
+        if self.changed_products:
+            self.patching_products |= self.changed_products
+            self.changed_products = set()
+            product_ids = list(self.patching_products)
+            self.executor.submit('patch_products', get_products_by_ids, product_ids,
+                                 on_result=partial(self.patch_products, product_ids))
+
+        if self.changed_orders:
+            self.patching_orders |= self.changed_orders
+            self.changed_orders = set()
+            order_ids = list(self.patching_orders)
+            self.executor.submit('patch_orders', get_orders_by_ids, order_ids,
+                                 on_result=partial(self.patch_orders, order_ids))
+
+        if self.categories_changed:
+            self.categories_changed = False
+            self.get_data_categories()
+            self.get_categories_parent_category()
+            self.get_categories_parent_category_2()
+            self.get_categories()
+            self.get_data_product()
+
+    def patch_products(self, product_ids, records):
+        self.patching_products.difference_update(product_ids)
+        self.product_store.patch(product_ids, records)
+
+    def patch_orders(self, order_ids, records):
+        self.patching_orders.difference_update(order_ids)
+        self.model_table_main_orders.patch(order_ids, records)
+
+    def collect_unused_images(self):
+        self.executor.submit('collect_images', collect_unused_images)
+
+    def revalidate_thumbnails(self, created):
+        # Сверка локального кеша миниатюр идёт в пуле загрузчика изображений, без курсора ожидания.
+        self.catalog_images.executor.submit('revalidate', revalidate_thumbnails,
+                                            on_result=self.thumbnails_revalidated)
+
+    def thumbnails_revalidated(self, image_ids):
+        for loader in (self.catalog_images, self.product_images):
+            loader.reload(image_ids)
+
+    def load_pages(self, key, model, function, *args):
+        model.reload(lambda after, limit: self.executor.submit(key, function, *args, after, limit,
+                                                                on_result=model.add_page,
+                                                                on_error=model.load_failed))
+
+    def reload_all(self):
+        self.get_data_product()
+        self.get_categories()
+        self.get_data_orders()
+        self.get_data_categories()
+
+    def set_busy(self, busy):
+        if busy:
+            QApplication.setOverrideCursor(Qt.BusyCursor)
+        else:
+            QApplication.restoreOverrideCursor()
+
     def line_edit(self):
         report_type = self.ui.comboBox.currentText()
         if report_type == 'Вывод количества заказанного товара по дням с итоговой суммой':
@@ -203,13 +489,33 @@ class MainWindow(QMainWindow):
             self.ui.lineEdit.setEnabled(False)
 
     def report_output(self):
+        report_type = self.ui.comboBox.currentText()
+        selected_date = self.ui.lineEdit.text()
+
+        if report_type == 'Вывод количества заказанного товара по дням с итоговой суммой':
+            try:
+                datetime.strptime(selected_date, '%Y-%m-%d')
+            except ValueError:
+                show_error_message('Дата введена не верно! Пожалуйста, введите дату в формате Г - М - Д.')
+                return
+
+        report_queries = {
+            'Всего товаров в магазине': (product_quantity,),
+            'Вывод родительских категорий по категориям': (categories_parents,),
+            'Вывод категорий с их количеством': (categories_count,),
+            'Вывод всех заказов с исходным количеством': (order_count,),
+            'Вывод количества заказанного товара по дням с итоговой суммой': (product_quantity_date, selected_date),
+        }
+        if report_type in report_queries:
+            self.executor.submit('report', *report_queries[report_type],
+                                 on_result=partial(self.show_report, report_type, selected_date))
+
+    def show_report(self, report_type, selected_date, result):
         try:
-            report_type = self.ui.comboBox.currentText()
             if report_type == 'Всего товаров в магазине':
-                products = product_quantity()
                 content = 'Список товаров и их количество:\n\n'
                 total_quantity = 0
-                for product in products:
+                for product in result:
                     content += f'ID товара: {product["id_product"]}\n'
                     content += f'Наименование товара: {product["name"]}\n'
                     content += f'Количество товара: {product["quantity"]}\n\n'
@@ -219,7 +525,6 @@ class MainWindow(QMainWindow):
 
             if report_type == 'Вывод родительских категорий по категориям':
                 content = 'Вывод родительских категорий по категориям:\n'
-                result = categories_parents()
                 current_category = None
                 for row in result:
                     category_name, parent_name = row
@@ -232,7 +537,6 @@ class MainWindow(QMainWindow):
 
             if report_type == 'Вывод категорий с их количеством':
                 content = 'Вывод категорий с их количеством:\n\n'
-                result = categories_count()
                 total_quantity = 0
                 for row in result:
                     category_name, category_count = row
@@ -244,7 +548,6 @@ class MainWindow(QMainWindow):
 
             if report_type == 'Вывод всех заказов с исходным количеством':
                 content = 'Вывод заказов с исходным количеством:\n\n'
-                result = order_count()
                 total_quantity = 0
                 for row in result:
                     id_order, order_date, record_count = row
@@ -255,16 +558,7 @@ class MainWindow(QMainWindow):
                 create_pdf_report(content)
 
             if report_type == 'Вывод количества заказанного товара по дням с итоговой суммой':
-                selected_date = self.ui.lineEdit.text()
-
-                try:
-                    datetime.strptime(selected_date, '%Y-%m-%d')
-                except ValueError:
-                    show_error_message('Дата введена не верно! Пожалуйста, введите дату в формате Г - М - Д.')
-                    return
-
                 content = f'Количество товара по дате заказа ({selected_date}):\n'
-                result = product_quantity_date(selected_date)
                 total_quantity = 0
                 for row in result:
                     order_date, name, amount, category, price = row
@@ -272,7 +566,7 @@ class MainWindow(QMainWindow):
                     content += f'Наименование товара: {name}\n'
                     content += f'Категория товара {category}\n'
                     content += f'Количество: {amount}\n'
-                    content += f'Цена: {price}\n'
+                    content += f'Цена: {format_price(price)}\n'
                     total_quantity += amount
                 content += f'\n'
                 content += f'Итоговое количество: {total_quantity}\n'
@@ -300,206 +594,157 @@ class MainWindow(QMainWindow):
         except Exception as e:
             print(f'Ошибка: {e}')
 
-    def double_click_add_list(self):
+    def double_click_add_list(self, index):
+        if is_action(self.ui.listOrder, index):
+            return
         self.ui.Widget_pages.setCurrentWidget(self.ui.pageInfoAboutOrder)
         selected_row = self.ui.listOrder.currentIndex().row()
-        order_item = self.model_table_main_orders.item(selected_row, 0)
+        order_item_text = self.model_table_main_orders.text(selected_row, 0)
 
-        if order_item and order_item.text() is not None:
-            order_item_text = order_item.text()
-            order_details_data = get_order_details(order_item_text)
-            self.order_details_listview(order_details_data)
+        if order_item_text is not None:
+            self.executor.submit('order_details', get_order_details, order_item_text,
+                                 on_result=self.order_details_listview)
 
     def order_details_listview(self, order_details_data):
         try:
             self.order_lines.clear()
             selected_row = self.ui.listOrder.currentIndex().row()
-            order_item = self.model_table_main_orders.item(selected_row, 0)
+            order_item_text = self.model_table_main_orders.text(selected_row, 0)
 
-            if order_item and order_item.text() is not None:
-                order_item_text = order_item.text()
+            if order_item_text is not None:
                 self.order_lines.append(f'Заказ: {order_item_text}')
-                total_sum = 0
+                total_sum = order_details_data[0][5] if order_details_data else 0
                 for record in order_details_data:
                     self.order_lines.append(
-                        f' Наименование: {record[0]}\n Категория: {record[1]}\n Количество: {record[3]}\n Цена: {record[4]}\'')
-                    total_sum += float(record[4].replace('$', '').replace(',', '.'))
-                self.order_lines.append(f' Итоговая цена заказа: {total_sum:.2f}')
+                        f' Наименование: {record[0]}\n Категория: {record[1]}\n Количество: {record[3]}\n'
+                        f' Цена: {format_price(record[4])}\'')
+                self.order_lines.append(f' Итоговая цена заказа: {format_price(total_sum)}')
                 self.order_details_model.setStringList(self.order_lines)
 
         except Exception as e:
             print(f'Ошибка: {e}')
 
+    def update_quantity(self, row, delta, model):
+        # Нажатия, сделанные до ответа базы, складываются и применяются к последнему ответу.
+        product_name = model.text(row, 0)
+        if product_name is None:
+            return
+        key = f'cart_quantity {product_name}'
+        self.quantity_deltas[key] = self.quantity_deltas.get(key, 0) + delta
+        self.executor.submit(key, get_products_facts_by_names, [product_name],
+                             on_result=partial(self.quantity_checked, key, model, product_name),
+                             on_error=partial(self.quantity_failed, key))
+
+    def quantity_checked(self, key, model, product_name, products):
+        delta = self.quantity_deltas.pop(key, 0)
+        row = find_product_row(model, product_name)
+        if row is not None:
+            update_quantity(row, delta, model, products[product_name])
+
+    def quantity_failed(self, key, error):
+        self.quantity_deltas.pop(key, None)
+        print(f'Ошибка: {error}')
+
     def update_quantity_2(self, row, delta, model):
         selected_row = self.ui.listOrder.currentIndex().row()
-        order_item = self.model_table_main_orders.item(selected_row, 0)
-
-        if order_item and order_item.text() is not None:
-            order_item_text = order_item.text()
-            try:
-                product_name_item = model.item(row, 0)
-                product_name = product_name_item.text()
-                product_id = get_product_id(product_name)
-                amount_item = model.item(row, 3)
-                current_quantity = int(amount_item.text())
-                new_amount = current_quantity + delta
-                quantity = get_product_quantity(product_id)
-                order_quantity = get_order_quantity(order_item_text, product_id)
-
-                if new_amount < 0:
-                    show_error_message('Количество товара не может быть отрицательным')
-                    return
-
-                if new_amount - order_quantity > quantity:
-                    show_error_message('На складе недостаточно товара')
-                    return
+        order_item_text = self.model_table_main_orders.text(selected_row, 0)
+        product_name = model.text(row, 0)
+
+        if order_item_text is not None and product_name is not None:
+            key = f'order_quantity {product_name}'
+            self.quantity_deltas[key] = self.quantity_deltas.get(key, 0) + delta
+            self.executor.submit(key, get_order_line_product, order_item_text, product_name,
+                                 on_result=partial(self.order_quantity_checked, key, model, product_name),
+                                 on_error=partial(self.quantity_failed, key))
+
+    def order_quantity_checked(self, key, model, product_name, result):
+        delta = self.quantity_deltas.pop(key, 0)
+        row = find_product_row(model, product_name)
+        if row is None:
+            return
+        try:
+            product, order_quantity = result
+            product_id = product['id_product']
+            current_quantity = int(model.text(row, 3))
+            new_amount = current_quantity + delta
+            quantity = product['amount']
+
+            if new_amount < 0:
+                show_error_message('Количество товара не может быть отрицательным')
+                return
 
-                with connection.cursor() as cursor:
-                    cursor.execute('''
-                        SELECT price
-                        FROM product
-                        WHERE id_product = %s
-                    ''', (product_id,))
-                    result = cursor.fetchone()
-                    price_text = result[0] if result else '0.0'
+            if new_amount - order_quantity > quantity:
+                show_error_message('На складе недостаточно товара')
+                return
 
-                price = float(price_text.replace('$', '').replace(',', '').strip())
+            price = product['price']
 
-                self.updates.append({
-                    'product_id': product_id,
-                    'delta': delta,
-                    'new_amount': new_amount,
-                    'price': price
-                })
+            self.updates.append({
+                'product_id': product_id,
+                'delta': delta,
+                'new_amount': new_amount,
+                'price': price
+            })
 
-                amount_item.setText(str(new_amount))
-                total_price_item = model.item(row, 5)
-                total_price = new_amount * price
-                total_price_item.setText('${:.2f}'.format(total_price))
+            model.set_cell(row, 3, str(new_amount))
+            model.set_cell(row, 5, format_price(new_amount * price), new_amount * price)
 
-            except Exception as e:
-                print(f'Ошибка: {e}')
+        except Exception as e:
+            print(f'Ошибка: {e}')
 
     def edit_order(self):
         selected_row = self.ui.listOrder.currentIndex().row()
-        order_item = self.model_table_main_orders.item(selected_row, 0)
+        order_item_text = self.model_table_main_orders.text(selected_row, 0)
 
-        if order_item and order_item.text() is not None:
-            order_item_text = order_item.text()
+        if order_item_text is not None:
             try:
-                with connection.cursor() as cursor:
-                    for row_index in self.rows:
-                        product = self.model_table_edit_order.item(row_index, 0)
-                        if product and product.text() is not None:
-                            product_name = product.text()
-                            product_id = get_product_id(product_name)
-
-                            new_amount_item = self.model_table_edit_order.item(row_index, 3)
-                            price_item = self.model_table_edit_order.item(row_index, 5)
-
-                            if new_amount_item is not None and price_item is not None:
-                                cursor.execute('''
-                                    SELECT amount
-                                    FROM order_details
-                                    WHERE id_order = %s AND id_product = %s
-                                ''', (order_item_text, product_id))
-
-                                result = cursor.fetchone()
-                                existing_quantity = result[0] if result and result[0] is not None else 0
-
-                                new_amount = int(new_amount_item.text()) if new_amount_item.text() else 0
-                                price_text = price_item.text() if price_item.text() else '0'
-                                price = float(price_text.replace('$', '').replace(',', '').strip())
-
-                                cursor.execute('''
-                                    UPDATE order_details
-                                    SET amount = %s, price = %s
-                                    WHERE id_order = %s AND id_product = %s
-                                ''', (new_amount, price, order_item_text, product_id))
-
-                                update_product_amount(product_id, new_amount - existing_quantity)
-
-                    connection.commit()
-                self.ui.Widget_pages.setCurrentWidget(self.ui.pageOrderList)
-                self.get_data_product()
+                order_lines = []
+                for row_index in self.rows:
+                    product_name = self.model_table_edit_order.text(row_index, 0)
+                    if product_name is not None:
+                        new_amount_text = self.model_table_edit_order.text(row_index, 3)
+                        new_amount = int(new_amount_text) if new_amount_text else 0
+                        price = self.model_table_edit_order.value(row_index, 5) or 0
+                        order_lines.append((product_name, new_amount, price))
 
             except Exception as e:
                 print(f'Ошибка: {e}')
+                return
+
+            self.ui.applyEditOrder.setEnabled(False)
+            self.executor.submit('edit_order', save_order_lines, order_item_text, order_lines,
+                                 on_result=self.order_edited, on_error=self.order_edit_failed)
+
+    def order_edited(self, result):
+        self.ui.applyEditOrder.setEnabled(True)
+        self.patch_products(*result)
+        self.ui.Widget_pages.setCurrentWidget(self.ui.pageOrderList)
+
+    def order_edit_failed(self, error):
+        self.ui.applyEditOrder.setEnabled(True)
+        print(f'Ошибка: {error}')
 
     def edit_product_order(self):
         self.ui.Widget_pages.setCurrentWidget(self.ui.pageEditOrder)
         selected_row = self.ui.listOrder.currentIndex().row()
-        order_item = self.model_table_main_orders.item(selected_row, 0)
+        order_item_text = self.model_table_main_orders.text(selected_row, 0)
 
-        if order_item and order_item.text() is not None:
-            order_item_text = order_item.text()
+        if order_item_text is not None:
+            self.executor.submit('edit_order_details', get_order_details, order_item_text,
+                                 on_result=self.edit_order_details_loaded)
 
-            try:
-                with connection.cursor() as cursor:
-                    cursor.execute('''
-                        SELECT P.name, C.name_categories, OD.amount, OD.price
-                        FROM order_details OD
-                        INNER JOIN product P ON OD.id_product = P.id_product
-                        INNER JOIN categories_parent_category CPC ON P.id_category = CPC.id_categories_parent_category
-                        JOIN categories C ON CPC.id_categories = C.id_categories
-                        WHERE OD.id_order = %s
-                    ''', (order_item_text,))
-
-                    order_details_data = cursor.fetchall()
-
-                    self.model_table_edit_order.clear()
-                    self.ui.editOrder.setModel(self.model_table_edit_order)
-                    self.model_table_edit_order.setColumnCount(6)
-                    self.model_table_edit_order.setHorizontalHeaderLabels(
-                        ['Наименование', 'Категория', '', 'Количество', '', 'Цена'])
-
-                    for row, details in enumerate(order_details_data, start=1):
-                        self.model_table_edit_order.appendRow([
-                            QStandardItem(str(details[0])),
-                            QStandardItem(str(details[1])),
-                            QStandardItem(''),
-                            QStandardItem(str(details[2])),
-                            QStandardItem(''),
-                            QStandardItem(str(details[3]))
-                        ])
-
-                        index = self.model_table_edit_order.rowCount() - 1
-
-                        for i in range(0, 6):
-                            if i not in [2, 4]:
-                                self.ui.editOrder.horizontalHeader().setSectionResizeMode(i, QHeaderView.Stretch)
-                            else:
-                                self.ui.editOrder.horizontalHeader().setSectionResizeMode(i, QHeaderView.Fixed)
-                                self.ui.editOrder.horizontalHeader().resizeSection(i, 65)
-
-                        button_plus = QPushButton(self)
-                        button_plus.setFixedSize(60, 60)
-                        button_plus.setIcon(QIcon(QPixmap(directory + '/icon/plus.png').scaled(QSize(60, 60))))
-                        button_plus.clicked.connect(
-                            lambda _, r=index: self.update_quantity_2(r, 1, self.model_table_edit_order))
-                        self.ui.editOrder.setIndexWidget(self.model_table_edit_order.index(index, 2), button_plus)
-
-                        button_minus = QPushButton(self)
-                        button_minus.setFixedSize(60, 60)
-                        button_minus.setIcon(QIcon(QPixmap(directory + '/icon/minus.png').scaled(QSize(60, 60))))
-                        button_minus.clicked.connect(
-                            lambda _, r=index: self.update_quantity_2(r, -1, self.model_table_edit_order))
-                        self.ui.editOrder.setIndexWidget(self.model_table_edit_order.index(index, 4), button_minus)
-                        self.ui.editOrder.verticalHeader().setDefaultSectionSize(65)
-
-                        self.rows.append(index)
-
-            except Exception as e:
-                print(f'Ошибка: {e}')
+    def edit_order_details_loaded(self, order_details_data):
+        order_details_data = order_details_data or []
+        self.model_table_edit_order.set_rows(
+            order_line_cells(str(details[0]), str(details[1]), str(details[3]), details[4])
+            for details in order_details_data)
+        self.rows.extend(range(len(order_details_data)))
 
     def delete_order(self):
         try:
-            with connection.cursor() as cursor:
+            with get_connection() as connection, connection.cursor() as cursor:
                 selected_row = self.ui.listOrder.currentIndex().row()
-                order_item = self.model_table_main_orders.item(selected_row, 0)
-
-                if order_item and order_item.text() is not None:
-                    order_item_text = order_item.text()
+                order_item_text = self.model_table_main_orders.text(selected_row, 0)
 
                 cursor.execute('''
                        DELETE FROM "order" 
@@ -514,91 +759,30 @@ class MainWindow(QMainWindow):
             self.get_data_orders()
 
     def get_data_orders(self):
-        try:
-            with connection.cursor() as cursor:
-                cursor.execute('''
-                    SELECT O.id_order, O.order_date
-                    FROM "order" O
-                    ORDER BY O.id_order;
-                ''')
-                records = cursor.fetchall()
-                del_records = []
-
-                self.model_table_main_orders.clear()
-                self.model_table_main_orders.setColumnCount(4)
-                self.model_table_main_orders.setHorizontalHeaderLabels(
-                    ['Номер заказа', 'Дата заказа', '', ''])
-                self.horizontal_header = self.ui.listOrder.horizontalHeader()
-
-                for i in range(0, 2):
-                    self.horizontal_header.setSectionResizeMode(i, QHeaderView.Stretch)
+        self.load_pages('orders', self.model_table_main_orders, get_orders)
 
-                for i in range(2, 4):
-                    self.horizontal_header.setSectionResizeMode(i, QHeaderView.Fixed)
-                    self.horizontal_header.resizeSection(i, 65)
-
-                for record in records:
-                    id_order = record[0]
-
-                    cursor.execute('''
-                        SELECT COUNT(*) 
-                        FROM order_details 
-                        WHERE id_order = %s
-                    ''', (id_order,))
-
-                    order = cursor.fetchone()[0] > 0
-
-                    if not order:
-                        cursor.execute('''
-                            DELETE FROM "order" 
-                            WHERE id_order = %s
-                        ''', (id_order,))
-                        connection.commit()
-                    else:
-                        del_records.append(record)
-
-                for index, record in enumerate(del_records, start=1):
-                    self.model_table_main_orders.appendRow([])
-                    for col, value in enumerate(record):
-                        item = QStandardItem(str(value))
-                        self.model_table_main_orders.setItem(index - 1, col, item)
-
-                    edit_button = QPushButton(self)
-                    edit_button.setFixedSize(60, 60)
-                    edit_button.setIcon(QIcon(
-                        QPixmap(directory + f'/icon/edit.png').scaled(QSize(60, 60))))
-                    edit_button.clicked.connect(lambda _, i=index - 1: self.edit_product_order())
-                    self.ui.listOrder.setIndexWidget(self.model_table_main_orders.index(index - 1, 2),
-                                                     edit_button)
-                    delete_button = QPushButton(self)
-                    delete_button.setFixedSize(60, 60)
-                    delete_button.setIcon(QIcon(QPixmap(directory + f'/icon/delete.png').scaled(QSize(60, 60))))
-                    delete_button.clicked.connect(lambda _, i=index - 1: self.delete_order())
-                    self.ui.listOrder.setIndexWidget(self.model_table_main_orders.index(index - 1, 3),
-                                                     delete_button)
-                self.ui.listOrder.verticalHeader().setDefaultSectionSize(65)
-
-        except Exception as e:
-            print(f'Ошибка: {e}')
+    def complete_order(self, order_id):
+        self.executor.submit(f'complete_order {order_id}', complete_order, order_id,
+                             on_result=partial(self.patch_orders, [order_id]))
 
     def double_click_add(self, index):
         selected_row = index.row()
         self.add_product_order(selected_row)
 
     def double_click_dell(self, index):
+        if is_action(self.ui.tableCatalogOrder, index):
+            return
         selected_row = index.row()
         self.remove_product_order(selected_row)
 
     def remove_product_order(self, row):
         try:
-            product_name = self.model_table_orders.item(row, 0)
-            category_name = self.model_table_orders.item(row, 1)
-            product_name = str(product_name.text())
-            category_name = str(category_name.text())
+            product_name = self.model_table_orders.text(row, 0)
+            category_name = self.model_table_orders.text(row, 1)
 
             for row in range(self.model_table_orders.rowCount() - 1, -1, -1):
-                if str(self.model_table_orders.item(row, 0).text()) == product_name and str(
-                        self.model_table_orders.item(row, 1).text()) == category_name:
+                if self.model_table_orders.text(row, 0) == product_name \
+                        and self.model_table_orders.text(row, 1) == category_name:
                     self.model_table_orders.removeRow(row)
                     break
 
@@ -607,51 +791,17 @@ class MainWindow(QMainWindow):
 
     def add_product_order(self, row):
         try:
-            product_name = self.model_table_product.item(row, 0)
-            category_name = self.model_table_product.item(row, 2)
-            product_name = str(product_name.text())
-            category_name = str(category_name.text())
+            product_name = self.model_table_product.text(row, 0)
+            category_name = self.model_table_product.text(row, 2)
 
-            for row in range(self.model_table_orders.rowCount()):
-                if str(self.model_table_orders.item(row, 0).text()) == product_name \
-                        and str(self.model_table_orders.item(row, 1).text()) == category_name:
+            for order_row in range(self.model_table_orders.rowCount()):
+                if self.model_table_orders.text(order_row, 0) == product_name \
+                        and self.model_table_orders.text(order_row, 1) == category_name:
                     show_error_message('Товар уже имеется в заказе!')
                     return
 
-            amount = self.model_table_product.item(row, 5)
-            price = self.model_table_product.item(row, 4)
-
-            self.model_table_orders.appendRow([
-                QStandardItem(product_name),
-                QStandardItem(category_name),
-                QStandardItem(''),
-                QStandardItem(amount),
-                QStandardItem(''),
-                QStandardItem(price)
-            ])
-            self.model_table_orders.setHorizontalHeaderLabels(
-                ['Наименование', 'Категория', '', 'Количество', '', 'Цена'])
-
-            index = self.model_table_orders.rowCount() - 1
-
-            for i in range(0, 6):
-                if i not in [2, 4]:
-                    self.ui.tableCatalogOrder.horizontalHeader().setSectionResizeMode(i, QHeaderView.Stretch)
-                else:
-                    self.ui.tableCatalogOrder.horizontalHeader().setSectionResizeMode(i, QHeaderView.Fixed)
-                    self.ui.tableCatalogOrder.horizontalHeader().resizeSection(i, 65)
-
-            button_plus = QPushButton(self)
-            button_plus.setFixedSize(60, 60)
-            button_plus.setIcon(QIcon(QPixmap(directory + '/icon/plus.png').scaled(QSize(60, 60))))
-            button_plus.clicked.connect(lambda _, r=index: update_quantity(r, 1, self.model_table_orders))
-            self.ui.tableCatalogOrder.setIndexWidget(self.model_table_orders.index(index, 2), button_plus)
-
-            button_minus = QPushButton(self)
-            button_minus.setFixedSize(60, 60)
-            button_minus.setIcon(QIcon(QPixmap(directory + '/icon/minus.png').scaled(QSize(60, 60))))
-            button_minus.clicked.connect(lambda _, r=index: update_quantity(r, -1, self.model_table_orders))
-            self.ui.tableCatalogOrder.setIndexWidget(self.model_table_orders.index(index, 4), button_minus)
+            price = self.model_table_product.value(row, 4)
+            self.model_table_orders.append_row(*order_line_cells(product_name, category_name, '', price))
 
         except Exception as e:
             print(f'Ошибка: {e}')
@@ -662,67 +812,34 @@ class MainWindow(QMainWindow):
             return
 
         try:
-            with connection.cursor() as cursor:
-                cursor.execute('''
-                    INSERT INTO "order" (order_date) 
-                    VALUES (CURRENT_DATE) 
-                    RETURNING id_order;
-                    ''')
-                new_order_id = cursor.fetchone()[0]
-
-                order_pdf = []
-
-                for row in range(self.model_table_orders.rowCount()):
-                    product_name = self.model_table_orders.item(row, 0).text()
-                    amount = int(self.model_table_orders.item(row, 3).text())
-                    price = self.model_table_orders.item(row, 5).text()
-                    product_id = get_product_id(product_name)
-                    current_quantity = get_product_quantity(product_id)
-                    order_pdf.append((product_name, product_id, amount, price))
-
-                    new_quantity = current_quantity - amount
-                    cursor.execute('''
-                        UPDATE product 
-                        SET amount = %s 
-                        WHERE id_product = %s;
-                    ''', (new_quantity, product_id))
-
-                    cursor.execute('''
-                        SELECT id_product
-                        FROM order_details
-                        WHERE id_order = %s AND id_product = %s;
-                    ''', (new_order_id, product_id))
-
-                    existing_entry = cursor.fetchone()
+            order_lines = []
+            for row in range(self.model_table_orders.rowCount()):
+                product_name = self.model_table_orders.text(row, 0)
+                amount = int(self.model_table_orders.text(row, 3))
+                order_lines.append((product_name, amount))
 
-                    if not existing_entry:
-                        cursor.execute('''
-                            INSERT INTO order_details (id_order, id_product, amount, price)
-                            VALUES (%s, %s, %s, %s);
-                        ''', (new_order_id, product_id, amount, price))
+        except Exception as e:
+            print(f'Ошибка: {e}')
+            return
 
-                connection.commit()
+        self.ui.placeOrder.setEnabled(False)
+        self.executor.submit('place_order', place_order, order_lines,
+                             on_result=self.order_placed, on_error=self.order_failed)
 
-                self.model_table_orders.clear()
-                self.model_table_orders.setColumnCount(6)
-                self.model_table_orders.setHorizontalHeaderLabels(
-                    ['Наименование', 'Категория', '', 'Количество', '', 'Цена'])
+    def order_failed(self, error):
+        self.ui.placeOrder.setEnabled(True)
+        print(f'Ошибка: {error}')
 
-                for i in range(0, 6):
-                    if i not in [2, 4]:
-                        self.ui.tableCatalogOrder.horizontalHeader().setSectionResizeMode(i, QHeaderView.Stretch)
-                    else:
-                        self.ui.tableCatalogOrder.horizontalHeader().setSectionResizeMode(i, QHeaderView.Fixed)
-                        self.ui.tableCatalogOrder.horizontalHeader().resizeSection(i, 65)
+    def order_placed(self, result):
+        self.ui.placeOrder.setEnabled(True)
+        new_order_id, order_pdf, product_ids, products = result
 
-                self.get_data_product()
-                self.get_data_main_product()
-                self.get_data_orders()
+        self.model_table_orders.set_rows([])
+        self.patch_products(product_ids, products)
 
-                generate_pdf(new_order_id, order_pdf)
+        self.get_data_orders()
 
-        except Exception as e:
-            print(f'Ошибка: {e}')
+        generate_pdf(new_order_id, order_pdf)
 
     def open_image_dialog_2(self, event):
         if event.button() == Qt.LeftButton:
@@ -748,12 +865,11 @@ class MainWindow(QMainWindow):
 
     def apply_function(self):
         if self.filter_enabled:
-            self.get_categories()
             self.ui.comboBox_categories.setEnabled(False)
             self.filter_enabled = False
-            self.get_data_product()
+            self.executor.cancel('search')
+            self.model_table_product.set_filter()
         else:
-            self.get_categories()
             self.ui.comboBox_categories.setEnabled(True)
             self.filter_enabled = True
             self.filter_product()
@@ -765,279 +881,70 @@ class MainWindow(QMainWindow):
             self.filter_product()
 
     def get_categories(self):
-        try:
-            with connection.cursor() as cursor:
-                cursor.execute('''
-                    SELECT name_categories 
-                    FROM categories 
-                    ORDER BY name_categories;
-                    ''')
-                categories = cursor.fetchall()
-                self.ui.comboBox_categories.clear()
-                self.ui.comboBox_categories.addItems([category[0] for category in categories])
-                self.ui.comboBox_categories.currentIndexChanged.connect(self.selected_category_products)
+        self.executor.submit('categories', get_category_names, on_result=self.categories_loaded)
 
-        except Exception as e:
-            print(f'Ошибка: {e}')
+    def categories_loaded(self, categories):
+        selected_category = self.ui.comboBox_categories.currentText()
+        self.ui.comboBox_categories.blockSignals(True)
+        self.ui.comboBox_categories.clear()
+        self.ui.comboBox_categories.addItems(categories)
+        self.ui.comboBox_categories.setCurrentText(selected_category)
+        self.ui.comboBox_categories.blockSignals(False)
+        if self.filter_enabled:
+            self.filter_product()
 
     def get_categories_parent_category(self):
-        try:
-            with connection.cursor() as cursor:
-                cursor.execute('''
-                    SELECT C.name_categories, PC.name
-                    FROM categories_parent_category CPC
-                    JOIN categories C ON CPC.id_categories = C.id_categories
-                    JOIN parent_category PC ON CPC.id_parent_categories = PC.id_parent_category
-                    ORDER BY C.name_categories;
-                ''')
-                categories = cursor.fetchall()
-
-                self.ui.comboBoxCategoriesProduct.clear()
-                self.ui.comboBoxCategoriesProduct.addItems(
-                    [f'{category[0]} - {category[1]}' for category in categories])
-        except Exception as e:
-            print(f'Ошибка: {e}')
+        self.executor.submit('categories_parent_category', get_category_pairs,
+                             on_result=partial(self.category_pairs_loaded, self.ui.comboBoxCategoriesProduct))
 
-    def filter_product(self):
-        select_category = self.ui.comboBox_categories.currentText()
-        try:
-            with connection.cursor() as cursor:
-                cursor.execute('''
-                    SELECT P.name, I.url, C.name_categories, P.amount, P.price
-                    FROM product P
-                    JOIN image I ON P.id_image = I.id_image
-                    JOIN categories_parent_category CPC ON P.id_category = CPC.id_categories_parent_category
-                    JOIN parent_category PC ON CPC.id_parent_categories = PC.id_parent_category
-                    JOIN categories C ON CPC.id_categories = C.id_categories
-                    WHERE C.name_categories = %s
-                    LIMIT 30;
-                ''', (select_category,))
-                records = cursor.fetchall()
-
-                self.model_table_product.clear()
-                self.model_table_product.setColumnCount(5)
-                self.model_table_product.setHorizontalHeaderLabels(
-                    ['Наименование', 'Изображение', 'категория', 'Количество', 'Цена'])
-                self.horizontal_header = self.ui.tableProductOrder.horizontalHeader()
-
-                for i in range(0, 5):
-                    self.horizontal_header.setSectionResizeMode(i, QHeaderView.Stretch)
-
-                for index, record in enumerate(records, start=1):
-                    self.model_table_product.appendRow([])
-                    for col, value in enumerate(record):
-                        if col == 1:
-                            pixmap = QPixmap()
-                            pixmap.loadFromData(value)
-                            scaled_pixmap = pixmap.scaled(QSize(150, 150), Qt.KeepAspectRatio)
-                            image_label = QLabel()
-                            image_label.setPixmap(scaled_pixmap)
-                            image_label.setAlignment(Qt.AlignCenter)
-                            self.ui.tableProductOrder.setIndexWidget(self.model_table_product.index(index - 1, col),
-                                                                     image_label)
-                        else:
-                            item = QStandardItem(str(value))
-                            self.model_table_product.setItem(index - 1, col, item)
+    def category_pairs_loaded(self, combo_box, categories):
+        # Список может обновиться, пока форма открыта, поэтому выбранная категория сохраняется.
+        selected_category = combo_box.currentText()
+        combo_box.clear()
+        combo_box.addItems([f'{category[0]} - {category[1]}' for category in categories])
+        combo_box.setCurrentText(selected_category)
 
-        except Exception as e:
-            print(f'Ошибка: {e}')
+    def filter_product(self):
+        self.executor.cancel('search')
+        self.model_table_product.set_filter(category=self.ui.comboBox_categories.currentText())
 
     def search_product(self):
         search_text = self.ui.lineEditSearch.text().strip()
-        try:
-            with connection.cursor() as cursor:
-                cursor.execute('''
-                    SELECT P.name, I.url, C.name_categories, P.amount, P.price
-                    FROM product P
-                    JOIN image I ON P.id_image = I.id_image
-                    JOIN categories_parent_category CPC ON P.id_category = CPC.id_categories_parent_category
-                    JOIN parent_category PC ON CPC.id_parent_categories = PC.id_parent_category
-                    JOIN categories C ON CPC.id_categories = C.id_categories
-                    WHERE LOWER(P.name) LIKE LOWER(%s) OR LOWER(C.name_categories) LIKE LOWER(%s);
-                ''', ('%' + search_text + '%', '%' + search_text + '%'))
-                records = cursor.fetchall()
-
-                self.model_table_product.clear()
-                self.model_table_product.setColumnCount(5)
-                self.model_table_product.setHorizontalHeaderLabels(
-                    ['Наименование', 'Изображение', 'категория', 'Количество', 'Цена'])
-                self.horizontal_header = self.ui.tableProductOrder.horizontalHeader()
-
-                for i in range(0, 5):
-                    self.horizontal_header.setSectionResizeMode(i, QHeaderView.Stretch)
-
-                for index, record in enumerate(records, start=1):
-                    self.model_table_product.appendRow([])
-                    for col, value in enumerate(record):
-                        if col == 1:
-                            pixmap = QPixmap()
-                            pixmap.loadFromData(value)
-                            scaled_pixmap = pixmap.scaled(QSize(150, 150), Qt.KeepAspectRatio)
-                            image_label = QLabel()
-                            image_label.setPixmap(scaled_pixmap)
-                            image_label.setAlignment(Qt.AlignCenter)
-                            self.ui.tableProductOrder.setIndexWidget(self.model_table_product.index(index - 1, col),
-                                                                     image_label)
-                        else:
-                            item = QStandardItem(str(value))
-                            self.model_table_product.setItem(index - 1, col, item)
-        except Exception as e:
-            print(f'Ошибка: {e}')
-
-    def get_data_main_product(self):
-        try:
-            with connection.cursor() as cursor:
-                cursor.execute('''
-                        SELECT P.name, I.url, C.name_categories  || ' - ' || PC.name AS category, P.description, P.amount, P.price
-                        FROM product P
-                        JOIN image I ON P.id_image = I.id_image
-                        JOIN categories_parent_category CPC ON P.id_category = CPC.id_categories_parent_category
-                        JOIN parent_category PC ON CPC.id_parent_categories = PC.id_parent_category
-                        JOIN categories C ON CPC.id_categories = C.id_categories;
-                    ''')
-                records = cursor.fetchall()
-
-                self.model_table_main_product.clear()
-                self.model_table_main_product.setColumnCount(8)
-                self.model_table_main_product.setHorizontalHeaderLabels(
-                    ['Наименование', 'Изображение', 'Категория', 'Описание', 'Количество', 'Цена', '', ''])
-                self.horizontal_header = self.ui.tableProduct.horizontalHeader()
-
-                for i in range(0, 6):
-                    self.horizontal_header.setSectionResizeMode(i, QHeaderView.Stretch)
-
-                for i in range(6, 8):
-                    self.horizontal_header.setSectionResizeMode(i, QHeaderView.Fixed)
-                    self.horizontal_header.resizeSection(i, 65)
-
-                for index, record in enumerate(records, start=1):
-                    self.model_table_main_product.appendRow([])
-                    for col, value in enumerate(record):
-                        if col == 1:
-                            pixmap = QPixmap()
-                            pixmap.loadFromData(value)
-                            scaled_pixmap = pixmap.scaled(QSize(150, 150), Qt.KeepAspectRatio)
-                            image_label = QLabel()
-                            image_label.setPixmap(scaled_pixmap)
-                            image_label.setAlignment(Qt.AlignCenter)
-                            self.ui.tableProduct.setIndexWidget(self.model_table_main_product.index(index - 1, col),
-                                                                image_label)
-                        else:
-                            item = QStandardItem(str(value))
-                            self.model_table_main_product.setItem(index - 1, col, item)
-
-                    edit_button = QPushButton(self)
-                    edit_button.setFixedSize(60, 60)
-                    edit_button.setIcon(QIcon(
-                        QPixmap(directory + f'/icon/edit.png').scaled(QSize(60, 60))))
-                    edit_button.clicked.connect(lambda _, i=index - 1: self.edit_product(i))
-                    self.ui.tableProduct.setIndexWidget(self.model_table_main_product.index(index - 1, 6),
-                                                        edit_button)
-                    delete_button = QPushButton(self)
-                    delete_button.setFixedSize(60, 60)
-                    delete_button.setIcon(QIcon(QPixmap(directory + f'/icon/delete.png').scaled(QSize(60, 60))))
-                    delete_button.clicked.connect(lambda _, i=index - 1: self.delete_product(i))
-                    self.ui.tableProduct.setIndexWidget(self.model_table_main_product.index(index - 1, 7),
-                                                        delete_button)
-                    self.ui.tableProduct.verticalHeader().setDefaultSectionSize(65)
+        if not search_text:
+            self.executor.cancel('search')
+            self.model_table_product.set_filter()
+            return
+        search = search_modes[self.ui.comboBoxSearchMode.currentIndex()]
+        self.executor.submit('search', search_catalog, search, search_text, on_result=self.show_search_results)
 
-        except Exception as e:
-            print(f'Ошибка: {e}')
+    def show_search_results(self, result):
+        records, products = result
+        self.product_store.upsert(products)
+        # Сброс индикатора сортировки возвращает порядок по релевантности.
+        self.ui.tableProductOrder.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.model_table_product.show_search_results(records)
 
     def get_data_product(self):
-        try:
-            with connection.cursor() as cursor:
-                cursor.execute('''
-                    SELECT P.name, I.url, C.name_categories, P.amount, P.price
-                    FROM product P
-                    JOIN image I ON P.id_image = I.id_image
-                    JOIN categories_parent_category CPC ON P.id_category = CPC.id_categories_parent_category
-                    JOIN parent_category PC ON CPC.id_parent_categories = PC.id_parent_category
-                    JOIN categories C ON CPC.id_categories = C.id_categories;
-                ''')
-                records = cursor.fetchall()
-
-                self.model_table_product.clear()
-                self.model_table_product.setColumnCount(5)
-                self.model_table_product.setHorizontalHeaderLabels(
-                    ['Наименование', 'Изображение', 'Категория', 'Количество', 'Цена'])
-                self.horizontal_header = self.ui.tableProductOrder.horizontalHeader()
-
-                for i in range(0, 5):
-                    self.horizontal_header.setSectionResizeMode(i, QHeaderView.Stretch)
-
-                for index, record in enumerate(records, start=1):
-                    self.model_table_product.appendRow([])
-                    for col, value in enumerate(record):
-                        if col == 1:
-                            pixmap = QPixmap()
-                            pixmap.loadFromData(value)
-                            scaled_pixmap = pixmap.scaled(QSize(150, 150), Qt.KeepAspectRatio)
-                            image_label = QLabel()
-                            image_label.setPixmap(scaled_pixmap)
-                            image_label.setAlignment(Qt.AlignCenter)
-                            self.ui.tableProductOrder.setIndexWidget(self.model_table_product.index(index - 1, col),
-                                                                     image_label)
-                        else:
-                            item = QStandardItem(str(value))
-                            self.model_table_product.setItem(index - 1, col, item)
-
-        except Exception as e:
-            print(f'Ошибка: {e}')
+        self.load_pages('products', self.product_store, get_products)
 
     def insert_data_product(self):
         try:
-            with connection.cursor() as cursor:
-                name_product = self.ui.lineEditNameProduct.text()
-                combo_box_product = self.ui.comboBoxCategoriesProduct.currentText()
-                description_product = self.ui.textEditDescriptionProduct.toPlainText()
-                amount_product = self.ui.lineEditAmountProduct.text()
-                price_product = self.ui.lineEditPriceProduct.text()
-
-                if name_product == '' or self.image_file is None or not self.image_file or description_product == '' \
-                        or amount_product == '' or price_product == '':
-                    show_error_message('Вы не ввели значения!')
-                    return
-
-                cursor.execute('''
-                               SELECT id_product 
-                               FROM product 
-                               WHERE name = %s;
-                           ''', (name_product,))
-                existing_product = cursor.fetchone()
-
-                if existing_product:
-                    show_error_message('Продукт с таким именем уже существует!')
-                    return
-
-                with open(self.image_file, 'rb') as f:
-                    image_data = f.read()
-
-                cursor.execute('''
-                    INSERT INTO image (url) 
-                    VALUES (%s) 
-                    RETURNING id_image;
-                    ''', (psycopg2.Binary(image_data),))
-                id_image = cursor.fetchone()[0]
-
-                category_name, parent_category_name = combo_box_product.split(' - ')
-
-                cursor.execute('''
-                    SELECT CPC.id_categories_parent_category
-                    FROM categories_parent_category CPC
-                    JOIN categories C ON CPC.id_categories = C.id_categories
-                    JOIN parent_category PC ON CPC.id_parent_categories = PC.id_parent_category
-                    WHERE C.name_categories = %s AND PC.name = %s;
-                ''', (category_name, parent_category_name))
+            name_product = self.ui.lineEditNameProduct.text()
+            combo_box_product = self.ui.comboBoxCategoriesProduct.currentText()
+            description_product = self.ui.textEditDescriptionProduct.toPlainText()
+            amount_product = self.ui.lineEditAmountProduct.text()
+            price_product = self.ui.lineEditPriceProduct.text()
+
+            if name_product == '' or self.image_file is None or not self.image_file or description_product == '' \
+                    or amount_product == '' or price_product == '':
+                show_error_message('Вы не ввели значения!')
+                return
 
-                id_categories_parent_category = cursor.fetchone()[0]
+            category_name, parent_category_name = combo_box_product.split(' - ')
 
-                cursor.execute('''
-                    INSERT INTO product (name, id_image, id_category, description, amount, price)
-                    VALUES (%s, %s, %s, %s, %s, %s) RETURNING id_product;
-                ''', (name_product, id_image, id_categories_parent_category, description_product, amount_product,
-                      price_product))
-            connection.commit()
+            self.executor.submit(f'insert_product {name_product}', insert_product, name_product, self.image_file,
+                                 category_name, parent_category_name, description_product, amount_product,
+                                 price_product, on_result=self.product_inserted)
 
         except Exception as e:
             print(f'Ошибка: {e}')
@@ -1049,56 +956,25 @@ class MainWindow(QMainWindow):
             self.ui.textEditDescriptionProduct.clear()
             self.ui.lineEditAmountProduct.clear()
             self.ui.lineEditPriceProduct.clear()
-            self.filter_product()
-            self.get_categories()
-            self.get_data_product()
-            self.get_data_main_product()
             self.ui.Widget_pages.setCurrentWidget(self.ui.pageProduct)
 
+    def product_inserted(self, written_products):
+        if written_products is None:
+            show_error_message('Продукт с таким именем уже существует!')
+            return
+        id_product, name_product = written_products[0][:2]
+        product_id_cache.put(name_product, id_product)
+        self.patch_products([id_product], written_products)
+
     def update_product(self):
         try:
             selected_row = self.ui.tableProduct.currentIndex().row()
-            original_name_product = self.model_table_main_product.item(selected_row, 0).text()
-            id_product = get_product_id(original_name_product)
-
-            with connection.cursor() as cursor:
-                cursor.execute('''
-                    SELECT id_product_order 
-                    FROM order_details 
-                    WHERE id_product = %s;
-                ''', (id_product,))
-                order_details_rows = cursor.fetchall()
-
-                if order_details_rows:
-                    show_error_message('Вы не можете изменить товар, пока у вас есть незавершенные заказы!')
-                    return
-
+            original_name_product = self.model_table_main_product.text(selected_row, 0)
             new_name_product = self.ui.lineEditNameProduct_2.text().strip()
-
-            if self.image_file_2 is not None:
-                with open(self.image_file_2, 'rb') as f:
-                    image_data = f.read()
-
-                with connection.cursor() as cursor:
-                    cursor.execute('''
-                        UPDATE image SET url = %s 
-                        WHERE id_image = (SELECT id_image FROM product WHERE name = %s LIMIT 1) 
-                        RETURNING id_image;
-                    ''', (psycopg2.Binary(image_data), original_name_product))
-
-                    fetch_result = cursor.fetchone()
-
-                    if fetch_result is not None:
-                        id_image = fetch_result[0]
-                    else:
-                        id_image = None
-            else:
-                id_image = None
-
             combo_box_product = self.ui.comboBoxCategoriesProduct_2.currentText()
             description_product = self.ui.textEditDescriptionProduct_2.toPlainText()
             amount_product = float(self.ui.lineEditAmountProduct_2.text())
-            price_product = float(self.ui.lineEditPriceProduct_2.text())
+            price_product = Decimal(self.ui.lineEditPriceProduct_2.text())
 
             if combo_box_product == '' or description_product == '' or amount_product == '':
                 show_error_message('Вы не ввели значения!')
@@ -1106,179 +982,104 @@ class MainWindow(QMainWindow):
 
             category_name, parent_category_name = combo_box_product.split(' - ')
 
-            with connection.cursor() as cursor:
-                cursor.execute('''
-                    SELECT CPC.id_categories_parent_category
-                    FROM categories_parent_category CPC
-                    JOIN categories C ON CPC.id_categories = C.id_categories
-                    JOIN parent_category PC ON CPC.id_parent_categories = PC.id_parent_category
-                    WHERE C.name_categories = %s AND PC.name = %s;
-                ''', (category_name, parent_category_name))
-
-                id_categories_parent_category = cursor.fetchone()[0]
-
-                cursor.execute('''
-                    UPDATE product
-                    SET name = %s, id_image = COALESCE(%s, id_image), id_category = %s, description = %s, amount = %s, price = %s
-                    WHERE id_product = %s
-                    RETURNING id_product, name;
-                ''', (new_name_product, id_image, id_categories_parent_category, description_product, amount_product,
-                      price_product, id_product))
-            connection.commit()
+            self.executor.submit(f'update_product {original_name_product}', update_product, original_name_product,
+                                 new_name_product, self.image_file_2, category_name, parent_category_name,
+                                 description_product, amount_product, price_product,
+                                 on_result=partial(self.product_updated, original_name_product, new_name_product))
 
         except Exception as e:
             print(f'Ошибка: {e}')
 
         finally:
-            self.filter_product()
-            self.get_data_product()
-            self.get_categories()
-            self.get_data_main_product()
             self.ui.Widget_pages.setCurrentWidget(self.ui.pageProduct)
 
+    def product_updated(self, original_name_product, new_name_product, result):
+        if result is None:
+            show_error_message('Вы не можете изменить товар, пока у вас есть незавершенные заказы!')
+            return
+        id_product, written_products = result
+        product_id_cache.invalidate(original_name_product, id_product)
+        product_id_cache.put(new_name_product, id_product)
+        self.patch_products([id_product], written_products)
+        self.collect_unused_images()
+
     def delete_product(self, row):
         try:
-            with connection.cursor() as cursor:
-                product_name = self.model_table_main_product.item(row, 0).text()
+            with get_connection() as connection, connection.cursor() as cursor:
+                product_name = self.model_table_main_product.text(row, 0)
                 product_id = get_product_id(product_name)
 
-                cursor.execute('''
-                    SELECT id_product_order 
-                    FROM order_details 
-                    WHERE id_product = %s;''', (product_id,))
-                order_details_rows = cursor.fetchall()
-
-                if order_details_rows:
-                    show_error_message('Вы не можете удалить товар, пока у вас есть незавершенные заказы!')
+                if product_in_order(cursor, product_id):
+                    show_error_message('Вы не можете удалить товар, который есть в заказах!')
                     return
 
-                cursor.execute('''
-                    SELECT id_image 
-                    FROM product 
-                    WHERE id_product = %s;
-                ''', (product_id,))
-                image_id = cursor.fetchone()[0]
-
                 cursor.execute('''
                     DELETE FROM product 
-                    WHERE id_product = %s;
+                    WHERE id_product = %s
+                    RETURNING id_product;
                 ''', (product_id,))
+                deleted_ids = [record[0] for record in cursor.fetchall()]
 
-                cursor.execute('''
-                    DELETE FROM image 
-                    WHERE id_image = %s;
-                ''', (image_id,))
-
-            connection.commit()
+                connection.commit()
+                product_id_cache.invalidate(product_name, product_id)
+                self.patch_products(deleted_ids, [])
 
         except Exception as e:
             print(f'Ошибка: {e}')
 
         finally:
-            self.filter_product()
-            self.get_data_product()
-            self.get_categories()
-            self.get_data_main_product()
             self.ui.Widget_pages.setCurrentWidget(self.ui.pageProduct)
             self.get_data_orders()
+            self.collect_unused_images()
 
     def edit_product(self, row):
         try:
             self.get_categories_parent_category_2()
             self.ui.Widget_pages.setCurrentWidget(self.ui.pageEditProduct)
-            name_product = self.model_table_main_product.item(row, 0).text()
-            description_product = self.model_table_main_product.item(row, 3).text()
-            amount_product = self.model_table_main_product.item(row, 4).text()
-            price_product = self.model_table_main_product.item(row, 5).text()
-            category_product = self.model_table_main_product.item(row, 2).text()
-
-            image_product = get_image_for_product(name_product)
-
-            if image_product:
-                image_base64 = base64.b64encode(image_product).decode('utf-8')
-                image_html = f'<img src="data:image/png;base64,{image_base64}" width="370">'
-                self.ui.textEditImageProduct_2.clear()
-                self.ui.textEditImageProduct_2.setHtml(image_html)
+            name_product = self.model_table_main_product.text(row, 0)
+            description_product = self.model_table_main_product.text(row, 3)
+            amount_product = self.model_table_main_product.text(row, 4)
+            price_product = self.model_table_main_product.value(row, 5)
+            category_product = self.model_table_main_product.text(row, 2)
+
+            # Файл, выбранный для предыдущего товара, не должен попасть в этот.
+            self.image_file_2 = None
+            self.ui.textEditImageProduct_2.clear()
+            self.executor.submit('product_image', get_image_for_product, name_product,
+                                 on_result=self.product_image_loaded)
 
             self.ui.textEditImageProduct_2.mousePressEvent = lambda event: self.open_image_dialog_2(event)
 
             self.ui.lineEditNameProduct_2.setText(name_product)
             self.ui.textEditDescriptionProduct_2.setPlainText(description_product)
             self.ui.lineEditAmountProduct_2.setText(amount_product)
-            self.ui.lineEditPriceProduct_2.setText(price_product.replace('$', ''))
+            self.ui.lineEditPriceProduct_2.setText(str(price_product))
             self.ui.comboBoxCategoriesProduct_2.setCurrentText(category_product)
 
-            if image_product is None:
-                self.ui.textEditImageProduct_2.clear()
-
         except Exception as e:
             print(f'Ошибка: {e}')
 
+    def product_image_loaded(self, image_product):
+        # Пока изображение загружалось, могло быть выбрано новое из файла.
+        if image_product and self.image_file_2 is None:
+            image_base64 = base64.b64encode(image_product).decode('utf-8')
+            image_html = f'<img src="data:image/png;base64,{image_base64}" width="370">'
+            self.ui.textEditImageProduct_2.setHtml(image_html)
+
     def get_categories_parent_category_2(self):
-        with connection.cursor() as cursor:
-            cursor.execute('''
-                SELECT C.name_categories, PC.name
-                FROM categories_parent_category CPC
-                JOIN categories C ON CPC.id_categories = C.id_categories
-                JOIN parent_category PC ON CPC.id_parent_categories = PC.id_parent_category
-            ''')
-            categories = cursor.fetchall()
-            category_names = [f'{name} - {parent}' for name, parent in categories]
-            self.ui.comboBoxCategoriesProduct_2.clear()
-            self.ui.comboBoxCategoriesProduct_2.addItems(category_names)
+        self.executor.submit('categories_parent_category_2', get_category_pairs,
+                             on_result=partial(self.category_pairs_loaded, self.ui.comboBoxCategoriesProduct_2))
 
     def get_data_categories(self):
-        try:
-            with connection.cursor() as cursor:
-                cursor.execute('''
-                    SELECT C.name_categories, P.name
-                    FROM categories_parent_category CPC
-                    JOIN categories C ON CPC.id_categories = C.id_categories
-                    JOIN parent_category P ON CPC.id_parent_categories = P.id_parent_category
-                    ORDER BY P.id_parent_category;
-                ''')
-                records = cursor.fetchall()
-
-                self.model_table_categories.clear()
-                self.model_table_categories.setColumnCount(4)
-                self.model_table_categories.setHorizontalHeaderLabels(
-                    ['Имя категории', 'Имя родительской категории', '', ''])
-                self.horizontal_header = self.ui.tableAddCategories.horizontalHeader()
-
-                for i in range(0, 2):
-                    self.horizontal_header.setSectionResizeMode(i, QHeaderView.Stretch)
-
-                for i in range(2, 4):
-                    self.horizontal_header.setSectionResizeMode(i, QHeaderView.Fixed)
-                    self.horizontal_header.resizeSection(i, 65)
-
-                for index, record in enumerate(records, start=1):
-                    self.model_table_categories.appendRow([])
-                    for col, value in enumerate(record):
-                        item = QStandardItem(str(value))
-                        self.model_table_categories.setItem(index - 1, col, item)
-
-                    edit_button = QPushButton(self)
-                    edit_button.setFixedSize(60, 60)
-                    edit_button.setIcon(QIcon(
-                        QPixmap(directory + f'/icon/edit.png').scaled(QSize(60, 60))))
-                    edit_button.clicked.connect(lambda _, i=index - 1: self.edit_categories(i))
-                    self.ui.tableAddCategories.setIndexWidget(self.model_table_categories.index(index - 1, 2),
-                                                              edit_button)
-                    delete_button = QPushButton(self)
-                    delete_button.setFixedSize(60, 60)
-                    delete_button.setIcon(QIcon(QPixmap(directory + f'/icon/delete.png').scaled(QSize(60, 60))))
-                    delete_button.clicked.connect(lambda _, i=index - 1: self.delete_categories(i))
-                    self.ui.tableAddCategories.setIndexWidget(self.model_table_categories.index(index - 1, 3),
-                                                              delete_button)
-                self.ui.tableAddCategories.verticalHeader().setDefaultSectionSize(65)
+        self.executor.submit('data_categories', get_category_pairs, 'PC.id_parent_category',
+                             on_result=self.data_categories_loaded)
 
-        except Exception as e:
-            print(f'Ошибка: {e}')
+    def data_categories_loaded(self, records):
+        self.model_table_categories.set_rows(([str(value) for value in record], ()) for record in records)
 
     def insert_data_categories(self):
         try:
-            with connection.cursor() as cursor:
+            with get_connection() as connection, connection.cursor() as cursor:
                 name_categories = self.ui.lineEditNameCategory.text()
                 parent_categories = self.ui.lineEditParentCategory.text()
 
@@ -1344,6 +1145,8 @@ class MainWindow(QMainWindow):
                     VALUES (%s, %s);
                 ''', (id_categories, id_parent_category))
                 connection.commit()
+                category_id_cache.put(name_categories, id_categories)
+                parent_category_id_cache.put(parent_categories, id_parent_category)
 
         except Exception as e:
             print(f'Ошибка: {e}')
@@ -1359,8 +1162,8 @@ class MainWindow(QMainWindow):
     def edit_categories(self, row):
         try:
             self.ui.Widget_pages.setCurrentWidget(self.ui.pageEditCategories)
-            categories_name = self.model_table_categories.item(row, 0).text()
-            parent_categories_name = self.model_table_categories.item(row, 1).text()
+            categories_name = self.model_table_categories.text(row, 0)
+            parent_categories_name = self.model_table_categories.text(row, 1)
             categories_id = get_category_id(categories_name)
             parent_categories_id = get_parent_category_id(parent_categories_name)
             self.ui.lineEditNameCategory_2.setText(categories_name)
@@ -1373,14 +1176,14 @@ class MainWindow(QMainWindow):
 
     def update_categories(self, row):
         try:
-            with connection.cursor() as cursor:
+            with get_connection() as connection, connection.cursor() as cursor:
                 new_categories_name = self.ui.lineEditNameCategory_2.text()
                 new_parent_categories_name = self.ui.lineEditParentCategory_2.text()
 
-                categories_name = self.model_table_categories.item(row, 0).text()
+                categories_name = self.model_table_categories.text(row, 0)
                 categories_id = get_category_id(categories_name)
 
-                if get_categories_in_order(cursor, categories_id):
+                if categories_in_open_order(cursor, categories_id):
                     show_error_message('Вы не можете обновить категорию, пока у вас есть незавершенные заказы!')
                     return
 
@@ -1409,6 +1212,11 @@ class MainWindow(QMainWindow):
                     ''', (new_parent_categories_name, self.current_edit_parent_categories_id))
 
                 connection.commit()
+                category_id_cache.invalidate(id_value=self.current_edit_categories_id)
+                category_id_cache.put(new_categories_name, self.current_edit_categories_id)
+                if new_parent_categories_name:
+                    parent_category_id_cache.invalidate(id_value=self.current_edit_parent_categories_id)
+                    parent_category_id_cache.put(new_parent_categories_name, self.current_edit_parent_categories_id)
 
         except Exception as e:
             print(f'Ошибка: {e}')
@@ -1420,17 +1228,29 @@ class MainWindow(QMainWindow):
 
     def delete_categories(self, row):
         try:
-            with connection.cursor() as cursor:
-                categories_name = self.model_table_categories.item(row, 0).text()
-                parent_categories_name = self.model_table_categories.item(row, 1).text()
+            with get_connection() as connection, connection.cursor() as cursor:
+                categories_name = self.model_table_categories.text(row, 0)
+                parent_categories_name = self.model_table_categories.text(row, 1)
 
                 categories_id = get_category_id(categories_name)
                 parent_categories_id = get_parent_category_id(parent_categories_name)
 
-                if get_categories_in_order(cursor, categories_id):
-                    show_error_message('Вы не можете удалить категорию, пока у вас есть незавершенные заказы!')
+                if categories_in_order(cursor, categories_id):
+                    show_error_message('Вы не можете удалить категорию, товары которой есть в заказах!')
                     return
 
+                # Товары удалились бы каскадно; удаляются явно, чтобы знать, сбрасывать ли кеш имён товаров.
+                cursor.execute('''
+                    DELETE FROM product
+                    WHERE id_category IN (
+                        SELECT id_categories_parent_category
+                        FROM categories_parent_category
+                        WHERE id_categories = %s AND id_parent_categories = %s
+                    )
+                    RETURNING id_product;
+                ''', (categories_id, parent_categories_id))
+                deleted_product_ids = [record[0] for record in cursor.fetchall()]
+
                 cursor.execute('''
                     DELETE FROM categories_parent_category
                     WHERE id_categories = %s AND id_parent_categories = %s;
@@ -1463,18 +1283,22 @@ class MainWindow(QMainWindow):
                     ''', (parent_categories_id,))
 
                 connection.commit()
+                category_id_cache.invalidate(categories_name, categories_id)
+                parent_category_id_cache.invalidate(parent_categories_name, parent_categories_id)
+                if deleted_product_ids:
+                    # Собственные уведомления не обрабатываются, а поиск по id обходит весь кеш для каждого товара.
+                    product_id_cache.clear()
 
         except Exception as e:
             print(f'Ошибка: {e}')
-            connection.rollback()
 
         finally:
             self.ui.Widget_pages.setCurrentWidget(self.ui.pageCategories)
-            self.get_data_main_product()
             self.get_data_categories()
             self.get_categories_parent_category()
+            self.get_categories()
             self.get_data_product()
-            delete_unused_images()
+            self.collect_unused_images()
 
     def animate_menu_width(self, enable):
         width = self.ui.frameLeftMenu.width()
@@ -1507,7 +1331,14 @@ class MainWindow(QMainWindow):
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
+    migrate()
     window = MainWindow()
+    app.aboutToQuit.connect(window.listener.stop)
+    app.aboutToQuit.connect(window.executor.shutdown)
+    app.aboutToQuit.connect(window.catalog_images.shutdown)
+    app.aboutToQuit.connect(window.product_images.shutdown)
+    app.aboutToQuit.connect(thumbnail_store.close)
+    app.aboutToQuit.connect(pool.closeall)
     window.showMaximized()
     apply_stylesheet(app, theme='dark_blue.xml', invert_secondary=True)
     window.show()
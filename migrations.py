@@ -0,0 +1,441 @@
+import psycopg2
+import psycopg2.errors
+
+from database import get_connection
+
+MIGRATION_LOCK_ID = 870112
+
+create_table_query = """
+CREATE TABLE IF NOT EXISTS public.categories
+(
+    id_categories integer NOT NULL DEFAULT nextval('categories_id_categories_seq'::regclass),
+    name_categories text COLLATE pg_catalog."default" NOT NULL,
+    CONSTRAINT categories_pkey PRIMARY KEY (id_categories),
+    CONSTRAINT unique_name_categories UNIQUE (name_categories)
+);
+
+CREATE TABLE IF NOT EXISTS public.parent_category
+(
+    id_parent_category integer NOT NULL GENERATED ALWAYS AS IDENTITY ( INCREMENT 1 START 1 MINVALUE 1 MAXVALUE 2147483647 CACHE 1 ),
+    name text COLLATE pg_catalog."default" NOT NULL,
+    CONSTRAINT parent_category_pkey PRIMARY KEY (id_parent_category),
+    CONSTRAINT unique_id UNIQUE (id_parent_category),
+    CONSTRAINT unique_name UNIQUE (name)
+);
+  
+CREATE TABLE IF NOT EXISTS public.categories_parent_category
+(
+    id_categories_parent_category integer NOT NULL GENERATED ALWAYS AS IDENTITY ( INCREMENT 1 START 1 MINVALUE 1 MAXVALUE 2147483647 CACHE 1 ),
+    id_categories integer NOT NULL,
+    id_parent_categories integer NOT NULL,
+    CONSTRAINT categories_parent_category_pkey PRIMARY KEY (id_categories_parent_category),
+    CONSTRAINT id_cetegories FOREIGN KEY (id_categories)
+        REFERENCES public.categories (id_categories) MATCH SIMPLE
+        ON UPDATE CASCADE
+        ON DELETE CASCADE,
+    CONSTRAINT id_parent_category FOREIGN KEY (id_parent_categories)
+        REFERENCES public.parent_category (id_parent_category) MATCH SIMPLE
+        ON UPDATE CASCADE
+        ON DELETE CASCADE
+);
+ 
+CREATE TABLE IF NOT EXISTS public.product
+(
+    id_product integer NOT NULL GENERATED ALWAYS AS IDENTITY ( INCREMENT 1 START 1 MINVALUE 1 MAXVALUE 2147483647 CACHE 1 ),
+    name text COLLATE pg_catalog."default" NOT NULL,
+    id_image integer NOT NULL,
+    id_category integer NOT NULL,
+    description text COLLATE pg_catalog."default" NOT NULL,
+    amount bigint NOT NULL DEFAULT nextval('product_amount_seq'::regclass),
+    price money NOT NULL,
+    CONSTRAINT product_pkey PRIMARY KEY (id_product),
+    CONSTRAINT categories_parent_categories FOREIGN KEY (id_category)
+        REFERENCES public.categories_parent_category (id_categories_parent_category) MATCH SIMPLE
+        ON UPDATE CASCADE
+        ON DELETE CASCADE,
+    CONSTRAINT image FOREIGN KEY (id_image)
+        REFERENCES public.image (id_image) MATCH SIMPLE
+        ON UPDATE CASCADE
+        ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS public.image
+(
+    id_image integer NOT NULL GENERATED ALWAYS AS IDENTITY ( INCREMENT 1 START 1 MINVALUE 1 MAXVALUE 2147483647 CACHE 1 ),
+    url bytea,
+    CONSTRAINT image_pkey PRIMARY KEY (id_image)
+);
+
+CREATE TABLE IF NOT EXISTS public."order"
+(
+    id_order integer NOT NULL GENERATED ALWAYS AS IDENTITY ( INCREMENT 1 START 1 MINVALUE 1 MAXVALUE 2147483647 CACHE 1 ),
+    order_date date NOT NULL,
+    CONSTRAINT order_pkey PRIMARY KEY (id_order)
+);
+
+CREATE TABLE IF NOT EXISTS public.order_details
+(
+    id_product_order integer NOT NULL GENERATED ALWAYS AS IDENTITY ( INCREMENT 1 START 1 MINVALUE 1 MAXVALUE 2147483647 CACHE 1 ),
+    id_product integer NOT NULL,
+    id_order integer NOT NULL,
+    amount integer NOT NULL,
+    price money NOT NULL,
+    CONSTRAINT product_order_pkey PRIMARY KEY (id_product_order),
+    CONSTRAINT "order" FOREIGN KEY (id_order)
+        REFERENCES public."order" (id_order) MATCH SIMPLE
+        ON UPDATE CASCADE
+        ON DELETE CASCADE
+        NOT VALID,
+    CONSTRAINT product FOREIGN KEY (id_product)
+        REFERENCES public.product (id_product) MATCH SIMPLE
+        ON UPDATE CASCADE
+        ON DELETE CASCADE
+        NOT VALID
+);
+    """
+
+create_schema_version_query = """
+CREATE TABLE IF NOT EXISTS public.schema_version
+(
+    version integer NOT NULL,
+    description text COLLATE pg_catalog."default" NOT NULL,
+    applied_at timestamp with time zone NOT NULL DEFAULT now(),
+    CONSTRAINT schema_version_pkey PRIMARY KEY (version)
+);
+"""
+
+create_index_query = """
+CREATE INDEX IF NOT EXISTS product_name_idx
+    ON public.product (name);
+
+CREATE INDEX IF NOT EXISTS product_lower_name_idx
+    ON public.product (LOWER(name));
+
+CREATE INDEX IF NOT EXISTS product_id_category_idx
+    ON public.product (id_category);
+
+CREATE INDEX IF NOT EXISTS order_details_id_order_id_product_idx
+    ON public.order_details (id_order, id_product);
+
+CREATE INDEX IF NOT EXISTS order_details_id_product_idx
+    ON public.order_details (id_product);
+
+CREATE INDEX IF NOT EXISTS order_order_date_idx
+    ON public."order" (order_date);
+
+CREATE INDEX IF NOT EXISTS categories_parent_category_id_categories_idx
+    ON public.categories_parent_category (id_categories);
+
+CREATE INDEX IF NOT EXISTS categories_parent_category_id_parent_categories_idx
+    ON public.categories_parent_category (id_parent_categories);
+"""
+
+create_notify_trigger_query = """
+CREATE OR REPLACE FUNCTION public.notify_data_change() RETURNS trigger
+    LANGUAGE plpgsql
+AS $$
+DECLARE
+    row_data jsonb;
+    payload jsonb;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        row_data := to_jsonb(OLD);
+    ELSE
+        row_data := to_jsonb(NEW);
+    END IF;
+
+    payload := jsonb_build_object('table', TG_TABLE_NAME, 'operation', TG_OP);
+    FOR i IN 0 .. TG_NARGS - 1 LOOP
+        payload := payload || jsonb_build_object(TG_ARGV[i], row_data -> TG_ARGV[i]);
+    END LOOP;
+
+    PERFORM pg_notify('data_change', payload::text);
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS product_notify ON public.product;
+CREATE TRIGGER product_notify
+    AFTER INSERT OR UPDATE OR DELETE ON public.product
+    FOR EACH ROW EXECUTE FUNCTION public.notify_data_change('id_product');
+
+DROP TRIGGER IF EXISTS order_notify ON public."order";
+CREATE TRIGGER order_notify
+    AFTER INSERT OR UPDATE OR DELETE ON public."order"
+    FOR EACH ROW EXECUTE FUNCTION public.notify_data_change('id_order');
+
+DROP TRIGGER IF EXISTS order_details_notify ON public.order_details;
+CREATE TRIGGER order_details_notify
+    AFTER INSERT OR UPDATE OR DELETE ON public.order_details
+    FOR EACH ROW EXECUTE FUNCTION public.notify_data_change('id_product_order', 'id_order', 'id_product');
+
+DROP TRIGGER IF EXISTS categories_notify ON public.categories;
+CREATE TRIGGER categories_notify
+    AFTER INSERT OR UPDATE OR DELETE ON public.categories
+    FOR EACH ROW EXECUTE FUNCTION public.notify_data_change('id_categories');
+
+DROP TRIGGER IF EXISTS parent_category_notify ON public.parent_category;
+CREATE TRIGGER parent_category_notify
+    AFTER INSERT OR UPDATE OR DELETE ON public.parent_category
+    FOR EACH ROW EXECUTE FUNCTION public.notify_data_change('id_parent_category');
+
+DROP TRIGGER IF EXISTS categories_parent_category_notify ON public.categories_parent_category;
+CREATE TRIGGER categories_parent_category_notify
+    AFTER INSERT OR UPDATE OR DELETE ON public.categories_parent_category
+    FOR EACH ROW EXECUTE FUNCTION public.notify_data_change('id_categories_parent_category');
+"""
+
+create_numeric_price_query = """
+ALTER TABLE public.product
+    ALTER COLUMN price TYPE numeric(12, 2) USING price::numeric;
+
+ALTER TABLE public.order_details
+    ALTER COLUMN price TYPE numeric(12, 2) USING price::numeric;
+"""
+
+create_order_status_query = """
+ALTER TABLE public."order"
+    ADD COLUMN IF NOT EXISTS status text COLLATE pg_catalog."default" NOT NULL DEFAULT 'open',
+    ADD CONSTRAINT order_status_check CHECK (status IN ('open', 'completed'));
+
+ALTER TABLE public.order_details
+    ADD COLUMN IF NOT EXISTS order_open boolean NOT NULL DEFAULT true;
+
+CREATE OR REPLACE FUNCTION public.order_details_set_order_open() RETURNS trigger
+    LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.order_open := COALESCE((SELECT status = 'open' FROM public."order" WHERE id_order = NEW.id_order), true);
+    RETURN NEW;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.order_sync_order_open() RETURNS trigger
+    LANGUAGE plpgsql
+AS $$
+BEGIN
+    UPDATE public.order_details
+    SET order_open = (NEW.status = 'open')
+    WHERE id_order = NEW.id_order AND order_open <> (NEW.status = 'open');
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS order_details_order_open ON public.order_details;
+CREATE TRIGGER order_details_order_open
+    BEFORE INSERT OR UPDATE OF id_order ON public.order_details
+    FOR EACH ROW EXECUTE FUNCTION public.order_details_set_order_open();
+
+DROP TRIGGER IF EXISTS order_order_open ON public."order";
+CREATE TRIGGER order_order_open
+    AFTER UPDATE OF status ON public."order"
+    FOR EACH ROW WHEN (OLD.status IS DISTINCT FROM NEW.status)
+    EXECUTE FUNCTION public.order_sync_order_open();
+
+CREATE INDEX IF NOT EXISTS order_details_open_id_product_idx
+    ON public.order_details (id_product)
+    WHERE order_open;
+"""
+
+create_thumbnail_query = """
+ALTER TABLE public.image
+    ADD COLUMN IF NOT EXISTS thumbnail_small bytea,
+    ADD COLUMN IF NOT EXISTS thumbnail_large bytea;
+"""
+
+create_thumbnail_hash_query = """
+ALTER TABLE public.image
+    ADD COLUMN IF NOT EXISTS thumbnail_hash text COLLATE pg_catalog."default"
+        GENERATED ALWAYS AS (md5(COALESCE(thumbnail_small, url))) STORED;
+"""
+
+create_image_dedup_query = """
+ALTER TABLE public.image
+    ADD COLUMN IF NOT EXISTS content_hash text COLLATE pg_catalog."default"
+        GENERATED ALWAYS AS (encode(sha256(url), 'hex')) STORED,
+    ADD COLUMN IF NOT EXISTS ref_count integer NOT NULL DEFAULT 0;
+
+UPDATE public.product P
+SET id_image = D.keep_id
+FROM (
+    SELECT id_image, MIN(id_image) OVER (PARTITION BY content_hash) AS keep_id
+    FROM public.image
+    WHERE content_hash IS NOT NULL
+) D
+WHERE P.id_image = D.id_image AND D.id_image <> D.keep_id;
+
+DELETE FROM public.image I
+WHERE I.content_hash IS NOT NULL
+  AND EXISTS (SELECT 1 FROM public.image K WHERE K.content_hash = I.content_hash AND K.id_image < I.id_image);
+
+UPDATE public.image I
+SET ref_count = R.refs
+FROM (SELECT id_image, COUNT(*) AS refs FROM public.product GROUP BY id_image) R
+WHERE I.id_image = R.id_image;
+
+CREATE UNIQUE INDEX IF NOT EXISTS image_content_hash_idx
+    ON public.image (content_hash);
+
+CREATE INDEX IF NOT EXISTS image_unreferenced_idx
+    ON public.image (id_image)
+    WHERE ref_count = 0;
+
+CREATE INDEX IF NOT EXISTS product_id_image_idx
+    ON public.product (id_image);
+
+CREATE OR REPLACE FUNCTION public.product_image_ref_count() RETURNS trigger
+    LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE public.image SET ref_count = ref_count + 1 WHERE id_image = NEW.id_image;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE public.image SET ref_count = ref_count - 1 WHERE id_image = OLD.id_image;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS product_image_ref_count ON public.product;
+CREATE TRIGGER product_image_ref_count
+    AFTER INSERT OR DELETE ON public.product
+    FOR EACH ROW EXECUTE FUNCTION public.product_image_ref_count();
+
+DROP TRIGGER IF EXISTS product_image_ref_count_update ON public.product;
+CREATE TRIGGER product_image_ref_count_update
+    AFTER UPDATE OF id_image ON public.product
+    FOR EACH ROW WHEN (OLD.id_image IS DISTINCT FROM NEW.id_image)
+    EXECUTE FUNCTION public.product_image_ref_count();
+"""
+
+create_large_object_query = """
+ALTER TABLE public.image
+    ADD COLUMN IF NOT EXISTS url_oid oid,
+    ADD COLUMN IF NOT EXISTS content_sha256 text COLLATE pg_catalog."default";
+
+UPDATE public.image SET content_sha256 = content_hash;
+
+ALTER TABLE public.image DROP COLUMN content_hash;
+ALTER TABLE public.image RENAME COLUMN content_sha256 TO content_hash;
+
+CREATE UNIQUE INDEX IF NOT EXISTS image_content_hash_idx
+    ON public.image (content_hash);
+
+CREATE OR REPLACE FUNCTION public.image_unlink_large_object() RETURNS trigger
+    LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM lo_unlink(OLD.url_oid);
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS image_unlink_large_object ON public.image;
+CREATE TRIGGER image_unlink_large_object
+    AFTER DELETE ON public.image
+    FOR EACH ROW WHEN (OLD.url_oid IS NOT NULL)
+    EXECUTE FUNCTION public.image_unlink_large_object();
+"""
+
+create_image_size_query = """
+ALTER TABLE public.image
+    ADD COLUMN IF NOT EXISTS original_size bigint,
+    ADD COLUMN IF NOT EXISTS stored_size bigint;
+
+UPDATE public.image
+SET original_size = octet_length(url), stored_size = octet_length(url)
+WHERE url IS NOT NULL;
+"""
+
+create_page_index_query = """
+CREATE INDEX IF NOT EXISTS product_name_id_product_idx
+    ON public.product ((name COLLATE "C"), id_product);
+
+CREATE INDEX IF NOT EXISTS product_id_category_name_idx
+    ON public.product (id_category, (name COLLATE "C"), id_product);
+"""
+
+# Фильтр по категории выполняется в CatalogProxyModel, постраничный запрос по категории больше не нужен.
+drop_category_page_index_query = """
+DROP INDEX IF EXISTS public.product_id_category_name_idx;
+"""
+
+create_trigram_index_query = """
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS product_name_trgm_idx
+    ON public.product USING gin (name gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS categories_name_categories_trgm_idx
+    ON public.categories USING gin (name_categories gin_trgm_ops);
+"""
+
+create_fulltext_search_query = """
+ALTER TABLE public.product
+    ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('russian', COALESCE(name, '')), 'A') ||
+        setweight(to_tsvector('russian', COALESCE(description, '')), 'B')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS product_search_vector_idx
+    ON public.product USING gin (search_vector);
+"""
+
+create_thumbnail_failed_query = """
+ALTER TABLE public.image
+    ADD COLUMN IF NOT EXISTS thumbnail_failed boolean NOT NULL DEFAULT false;
+
+CREATE INDEX IF NOT EXISTS image_thumbnail_backfill_idx
+    ON public.image (id_image)
+    WHERE (thumbnail_small IS NULL OR thumbnail_large IS NULL) AND NOT thumbnail_failed;
+"""
+
+MIGRATIONS = [
+    (1, 'Начальная схема', create_table_query),
+    (2, 'Индексы для поиска и соединений', create_index_query),
+    (3, 'Уведомления об изменении данных', create_notify_trigger_query),
+    (4, 'Цены в numeric вместо money', create_numeric_price_query),
+    (5, 'Статус заказа и индекс открытых заказов', create_order_status_query),
+    (6, 'Миниатюры изображений', create_thumbnail_query),
+    (7, 'Хеш миниатюры для локального кеша', create_thumbnail_hash_query),
+    (8, 'Дедупликация изображений и счётчик ссылок', create_image_dedup_query),
+    (9, 'Оригиналы изображений в больших объектах', create_large_object_query),
+    (10, 'Исходный и сохранённый размер изображений', create_image_size_query),
+    (11, 'Индексы постраничной загрузки товаров', create_page_index_query),
+    (12, 'Удаление индекса страниц товаров по категории', drop_category_page_index_query),
+    (13, 'Триграммный поиск по названиям товаров и категорий', create_trigram_index_query),
+    (14, 'Полнотекстовый поиск по названию и описанию товаров', create_fulltext_search_query),
+    (15, 'Отметка изображений, для которых не удалось создать миниатюры', create_thumbnail_failed_query),
+]
+
+
+def get_schema_version(cursor):
+    try:
+        cursor.execute('SELECT MAX(version) FROM schema_version;')
+        return cursor.fetchone()[0] or 0
+    except psycopg2.errors.UndefinedTable:
+        cursor.connection.rollback()
+        return 0
+
+
+def migrate():
+    latest_version = MIGRATIONS[-1][0]
+    with get_connection() as connection, connection.cursor() as cursor:
+        if get_schema_version(cursor) >= latest_version:
+            return
+
+        cursor.execute('SELECT pg_advisory_xact_lock(%s);', (MIGRATION_LOCK_ID,))
+        cursor.execute(create_schema_version_query)
+        current_version = get_schema_version(cursor)
+
+        for version, description, query in MIGRATIONS:
+            if version <= current_version:
+                continue
+            cursor.execute(query)
+            cursor.execute('''
+                INSERT INTO schema_version (version, description)
+                VALUES (%s, %s);
+            ''', (version, description))
+        connection.commit()
@@ -0,0 +1,51 @@
+import threading
+from collections import OrderedDict
+
+NAME_CACHE_SIZE = 1024
+
+
+class NameCache:
+    def __init__(self, max_size=NAME_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            if name in self._ids:
+                self._ids.move_to_end(name)
+                self.hits += 1
+                return self._ids[name]
+            self.misses += 1
+            return None
+
+    def put(self, name, id_value, generation=None):
+        # Значение, прочитанное до инвалидации, уже может быть устаревшим.
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._ids[name] = id_value
+            self._ids.move_to_end(name)
+            while len(self._ids) > self.max_size:
+                self._ids.popitem(last=False)
+
+    def invalidate(self, name=None, id_value=None):
+        with self._lock:
+            self.generation += 1
+            if name is not None:
+                self._ids.pop(name, None)
+            if id_value is not None:
+                for cached_name in [n for n, i in self._ids.items() if i == id_value]:
+                    del self._ids[cached_name]
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._ids.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._ids)}
@@ -0,0 +1,77 @@
+import json
+
+import psycopg2
+import psycopg2.extensions
+from PyQt5.QtCore import QObject, QSocketNotifier, QTimer, pyqtSignal
+
+from database import db, pool
+
+CHANNEL = 'data_change'
+RECONNECT_INTERVAL_MS = 5000
+
+
+class ChangeListener(QObject):
+    changed = pyqtSignal(object)
+    reconnected = pyqtSignal()
+
+    def __init__(self, channel=CHANNEL, parent=None):
+        super().__init__(parent)
+        self.channel = channel
+        self._connection = None
+        self._notifier = None
+        self._lost = False
+        self._reconnect_timer = QTimer(self)
+        self._reconnect_timer.setSingleShot(True)
+        self._reconnect_timer.setInterval(RECONNECT_INTERVAL_MS)
+        self._reconnect_timer.timeout.connect(self.start)
+
+    def start(self):
+        try:
+            self._connection = psycopg2.connect(**db)
+            self._connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with self._connection.cursor() as cursor:
+                cursor.execute(f'LISTEN {self.channel};')
+        except psycopg2.Error as e:
+            print(f'Ошибка: {e}')
+            self._reconnect_later()
+            return
+
+        self._notifier = QSocketNotifier(self._connection.fileno(), QSocketNotifier.Read, self)
+        self._notifier.activated.connect(self._poll)
+        if self._lost:
+            self._lost = False
+            self.reconnected.emit()
+
+    def stop(self):
+        self._reconnect_timer.stop()
+        if self._notifier is not None:
+            self._notifier.setEnabled(False)
+            self._notifier.deleteLater()
+            self._notifier = None
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _reconnect_later(self):
+        self.stop()
+        self._lost = True
+        self._reconnect_timer.start()
+
+    def _poll(self):
+        try:
+            self._connection.poll()
+        except psycopg2.Error as e:
+            print(f'Ошибка: {e}')
+            self._reconnect_later()
+            return
+
+        own_pids = pool.backend_pids()
+        while self._connection.notifies:
+            notify = self._connection.notifies.pop(0)
+            if notify.pid in own_pids:
+                continue
+            try:
+                payload = json.loads(notify.payload)
+            except ValueError:
+                continue
+            self.changed.emit(payload)
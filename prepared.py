@@ -0,0 +1,48 @@
+import threading
+from collections import Counter
+
+import psycopg2.errors
+
+
+class PreparedStatementRegistry:
+    def __init__(self):
+        self._statements = {}
+        self._calls = Counter()
+        self._lock = threading.Lock()
+
+    def register(self, name, query, types=()):
+        self._statements[name] = (query, types)
+
+    def prepare(self, cursor, name):
+        prepared = cursor.connection.prepared_statements
+        if name not in prepared:
+            query, types = self._statements[name]
+            if types:
+                cursor.execute(f'PREPARE {name} ({", ".join(types)}) AS {query}')
+            else:
+                cursor.execute(f'PREPARE {name} AS {query}')
+            prepared.add(name)
+
+    def execute(self, cursor, name, params=()):
+        prepared = cursor.connection.prepared_statements
+        self.prepare(cursor, name)
+
+        try:
+            if params:
+                cursor.execute(f'EXECUTE {name} ({", ".join(["%s"] * len(params))})', params)
+            else:
+                cursor.execute(f'EXECUTE {name}')
+        except psycopg2.errors.InvalidSqlStatementName:
+            prepared.discard(name)
+            raise
+
+        with self._lock:
+            self._calls[name] += 1
+
+    def call_counts(self):
+        with self._lock:
+            return dict(self._calls)
+
+    def reset_counts(self):
+        with self._lock:
+            self._calls.clear()
@@ -2,12 +2,16 @@ from PyQt5.QtGui import QTextDocument
 from PyQt5.QtPrintSupport import QPrinter
 from PyQt5.QtWidgets import QFileDialog
 
-from database import connection
+from database import get_connection
+
+
+def format_price(price):
+    return f'${price:.2f}'
 
 
 def product_quantity():
     try:
-        with connection.cursor() as cursor:
+        with get_connection() as connection, connection.cursor() as cursor:
             cursor.execute('''
                 SELECT id_product, name, amount
                 FROM product
@@ -23,18 +27,21 @@ def product_quantity():
         print(f'Ошибка: {e}')
 
 
+product_quantity_date_query = '''
+    SELECT O.order_date, P.name, OD.amount, C.name_categories, OD.price
+    FROM "order" O
+    JOIN order_details OD ON O.id_order = OD.id_order
+    JOIN product P ON OD.id_product = P.id_product
+    JOIN categories_parent_category CPC ON P.id_category = CPC.id_categories_parent_category
+    JOIN categories C ON CPC.id_categories = C.id_categories
+    WHERE O.order_date = %s
+'''
+
+
 def product_quantity_date(selected_date):
     try:
-        with connection.cursor() as cursor:
-            cursor.execute('''
-                SELECT O.order_date, P.name, OD.amount, C.name_categories, OD.price
-                FROM "order" O
-                JOIN order_details OD ON O.id_order = OD.id_order
-                JOIN product P ON OD.id_product = P.id_product
-                JOIN categories_parent_category CPC ON P.id_category = CPC.id_categories_parent_category
-                JOIN categories C ON CPC.id_categories = C.id_categories
-                WHERE O.order_date = %s
-            ''', (selected_date,))
+        with get_connection() as connection, connection.cursor() as cursor:
+            cursor.execute(product_quantity_date_query, (selected_date,))
             return cursor.fetchall()
     except Exception as e:
         print(f'Ошибка: {e}')
@@ -42,7 +49,7 @@ def product_quantity_date(selected_date):
 
 def categories_parents():
     try:
-        with connection.cursor() as cursor:
+        with get_connection() as connection, connection.cursor() as cursor:
             cursor.execute('''
                 SELECT C.name_categories, PC.name
                 FROM categories_parent_category CPC
@@ -58,7 +65,7 @@ def categories_parents():
 
 def categories_count():
     try:
-        with connection.cursor() as cursor:
+        with get_connection() as connection, connection.cursor() as cursor:
             cursor.execute('''
                 SELECT name_categories, COUNT(*) AS category_count
                 FROM categories
@@ -72,7 +79,7 @@ def categories_count():
 
 def order_count():
     try:
-        with connection.cursor() as cursor:
+        with get_connection() as connection, connection.cursor() as cursor:
             cursor.execute('''
                 SELECT id_order, order_date, COUNT(*) AS record_count
                 FROM "order"
@@ -92,15 +99,14 @@ def generate_pdf(order_id, order_pdf):
             content = f'ID заказа: {order_id}\n\nПозиции заказа:\n'
             total_sum = 0
             for detail in order_pdf:
-                product_name, product_id, amount, price_str = detail
-                price = float(price_str.replace('$', ''))
+                product_name, product_id, amount, price = detail
                 content += f'ID_товара: {product_id}\n'
                 content += f'Наименование товара: {product_name}\n'
                 content += f'Количество товара: {amount}\n'
-                content += f'Цена: ${price:.2f}\n\n'
+                content += f'Цена: {format_price(price)}\n\n'
                 total_sum += price
 
-            content += f'Итоговая сумма: ${total_sum:.2f}\n'
+            content += f'Итоговая сумма: {format_price(total_sum)}\n'
 
             doc.setPlainText(content)
             printer = QPrinter(QPrinter.PrinterResolution)
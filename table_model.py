@@ -0,0 +1,288 @@
+import os
+
+from PyQt5.QtCore import QAbstractTableModel, QEvent, QModelIndex, QRect, QSize, Qt
+from PyQt5.QtGui import QIcon, QPixmap
+from PyQt5.QtWidgets import QApplication, QHeaderView, QStyle, QStyledItemDelegate, QStyleOptionButton
+
+ICON_DIRECTORY = os.path.join(os.path.abspath(os.curdir), 'icon')
+ACTION_BUTTON_SIZE = 60
+ACTION_COLUMN_WIDTH = 65
+ACTION_ROW_HEIGHT = 65
+PAGE_SIZE = 200
+
+action_icons = {}
+
+
+def action_icon(name):
+    # Иконка читается с диска один раз и используется всеми строками всех таблиц.
+    if name not in action_icons:
+        pixmap = QPixmap(os.path.join(ICON_DIRECTORY, f'{name}.png'))
+        if not pixmap.isNull():
+            pixmap = pixmap.scaled(QSize(ACTION_BUTTON_SIZE, ACTION_BUTTON_SIZE))
+        action_icons[name] = QIcon(pixmap)
+    return action_icons[name]
+
+
+class RecordTableModel(QAbstractTableModel):
+    # Строка хранит текст ячеек и связанные с ними значения (Qt.UserRole) без объектов на каждую ячейку.
+    def __init__(self, headers, alignments=None, parent=None):
+        super().__init__(parent)
+        self.headers = headers
+        self.alignments = alignments or {}
+        self._texts = []
+        self._values = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._texts)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.headers[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            return self._texts[index.row()][index.column()]
+        if role == Qt.UserRole:
+            return self._values[index.row()][index.column()]
+        if role == Qt.TextAlignmentRole:
+            return self.alignments.get(index.column())
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.EditRole, Qt.UserRole):
+            return False
+        cells = self._values if role == Qt.UserRole else self._texts
+        cells[index.row()][index.column()] = value
+        self.dataChanged.emit(index, index, [role])
+        return True
+
+    def insertRows(self, row, count, parent=QModelIndex()):
+        self.beginInsertRows(parent, row, row + count - 1)
+        columns = len(self.headers)
+        self._texts[row:row] = [[None] * columns for _ in range(count)]
+        self._values[row:row] = [[None] * columns for _ in range(count)]
+        self.endInsertRows()
+        return True
+
+    def removeRows(self, row, count, parent=QModelIndex()):
+        self.beginRemoveRows(parent, row, row + count - 1)
+        del self._texts[row:row + count]
+        del self._values[row:row + count]
+        self.endRemoveRows()
+        return True
+
+    def text(self, row, column):
+        if 0 <= row < len(self._texts):
+            return self._texts[row][column] or ''
+        return None
+
+    def value(self, row, column):
+        if 0 <= row < len(self._values):
+            return self._values[row][column]
+        return None
+
+    def set_cell(self, row, column, text, value=None):
+        self._texts[row][column] = text
+        self._values[row][column] = value
+        index = self.index(row, column)
+        self.dataChanged.emit(index, index)
+
+    def set_row(self, row, texts, values=()):
+        self._texts[row] = self._cells(texts)
+        self._values[row] = self._cells(values)
+        self.dataChanged.emit(self.index(row, 0), self.index(row, len(self.headers) - 1))
+
+    def append_row(self, texts, values=()):
+        row = len(self._texts)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._texts.append(self._cells(texts))
+        self._values.append(self._cells(values))
+        self.endInsertRows()
+
+    def set_rows(self, rows):
+        self.beginResetModel()
+        self._texts = []
+        self._values = []
+        for texts, values in rows:
+            self._texts.append(self._cells(texts))
+            self._values.append(self._cells(values))
+        self.endResetModel()
+
+    def _cells(self, cells):
+        cells = list(cells)
+        return cells + [None] * (len(self.headers) - len(cells))
+
+
+class PagedTableModel(RecordTableModel):
+    # Строки приходят страницами по ключу сортировки; следующую страницу запрашивает представление через
+    # fetchMore, когда прокрутка доходит до последней загруженной строки.
+    def __init__(self, headers, cells, row_key, alignments=None, parent=None):
+        super().__init__(headers, alignments, parent)
+        self.cells = cells
+        self.row_key = row_key
+        self.page_size = PAGE_SIZE
+        self.load_page = None
+        self.last_key = None
+        self.has_more = False
+        self.loading = False
+        self.total = None
+        self.exact_total = True
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        header = super().headerData(section, orientation, role)
+        if section == 0 and orientation == Qt.Horizontal and role == Qt.DisplayRole and self.total is not None:
+            return f'{header} ({"" if self.exact_total else "≈"}{self.total})'
+        return header
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.has_more and not self.loading
+
+    def fetchMore(self, parent=QModelIndex()):
+        if self.canFetchMore(parent):
+            self.loading = True
+            self.load_page(self.last_key, self.page_size)
+
+    def reload(self, load_page):
+        # load_page(after, limit) запускает загрузку страницы, результат передаётся в add_page.
+        self.load_page = load_page
+        self.last_key = None
+        self.has_more = False
+        self.loading = True
+        load_page(None, self.page_size)
+
+    def add_page(self, result):
+        records, total = result
+        rows = [self.cells(record) for record in records]
+        if self.last_key is None:
+            self.set_rows(rows)
+        elif rows:
+            first = self.rowCount()
+            self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+            for texts, values in rows:
+                self._texts.append(self._cells(texts))
+                self._values.append(self._cells(values))
+            self.endInsertRows()
+        if rows:
+            self.last_key = self.row_key(*rows[-1])
+        self.has_more = len(rows) == self.page_size
+        self.loading = False
+        if total is not None:
+            self.total, self.exact_total = total
+            self.headerDataChanged.emit(Qt.Horizontal, 0, 0)
+
+    def load_failed(self, error):
+        self.loading = False
+        print(f'Ошибка: {error}')
+
+    def insertRows(self, row, count, parent=QModelIndex()):
+        self._add_to_total(count)
+        return super().insertRows(row, count, parent)
+
+    def removeRows(self, row, count, parent=QModelIndex()):
+        self._add_to_total(-count)
+        return super().removeRows(row, count, parent)
+
+    def key(self, row):
+        return self.row_key(self._texts[row], self._values[row])
+
+    def find_row(self, value):
+        for row in range(self.rowCount()):
+            if self._values[row][0] == value:
+                return row
+        return None
+
+    def insert_position(self, texts, values):
+        # Строка за последним загруженным ключом придёт с одной из следующих страниц.
+        key = self.row_key(texts, values)
+        if self.has_more and key > self.last_key:
+            return None
+        return next((row for row in range(self.rowCount()) if self.key(row) > key), self.rowCount())
+
+    def patch(self, values, records, accepts=None):
+        # values - значения первого столбца изменившихся строк, records - их актуальные записи.
+        records = {record[0]: record for record in records}
+        for value in values:
+            row = self.find_row(value)
+            record = records.get(value)
+            cells = None
+            if record is not None and (accepts is None or accepts(record)):
+                cells = self.cells(record)
+            if cells is not None and row is not None and self.key(row) == self.row_key(*cells):
+                self.set_row(row, *cells)
+                continue
+            if row is not None:
+                self.removeRow(row)
+            position = self.insert_position(*cells) if cells is not None else None
+            if position is not None:
+                self.insertRow(position)
+                self.set_row(position, *cells)
+
+    def _add_to_total(self, count):
+        if self.total is not None:
+            self.total += count
+            self.headerDataChanged.emit(Qt.Horizontal, 0, 0)
+
+
+class ActionDelegate(QStyledItemDelegate):
+    # Кнопка рисуется в ячейке, а не создаётся виджетом; ячейка со значением False недоступна.
+    def __init__(self, icon, callback, icon_size=None, parent=None):
+        super().__init__(parent)
+        self.icon = icon
+        self.callback = callback
+        self.icon_size = icon_size
+
+    def button_rect(self, rect):
+        size = min(ACTION_BUTTON_SIZE, rect.width(), rect.height())
+        button_rect = QRect(0, 0, size, size)
+        button_rect.moveCenter(rect.center())
+        return button_rect
+
+    def enabled(self, index):
+        return index.data(Qt.UserRole) is not False
+
+    def paint(self, painter, option, index):
+        style = option.widget.style() if option.widget is not None else QApplication.style()
+        button = QStyleOptionButton()
+        button.rect = self.button_rect(option.rect)
+        button.icon = self.icon
+        icon_size = self.icon_size or style.pixelMetric(QStyle.PM_ButtonIconSize, None, option.widget)
+        button.iconSize = QSize(icon_size, icon_size)
+        button.state = QStyle.State_Raised
+        if self.enabled(index):
+            button.state |= QStyle.State_Enabled
+        style.drawControl(QStyle.CE_PushButton, button, painter, option.widget)
+
+    def sizeHint(self, option, index):
+        return QSize(ACTION_COLUMN_WIDTH, ACTION_ROW_HEIGHT)
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() not in (QEvent.MouseButtonRelease, QEvent.MouseButtonDblClick):
+            return False
+        if event.button() != Qt.LeftButton or not self.button_rect(option.rect).contains(event.pos()):
+            return False
+        if event.type() == QEvent.MouseButtonRelease and self.enabled(index):
+            self.callback(index.row())
+        return True
+
+
+def set_action_columns(view, actions):
+    # actions: {столбец: (иконка, обработчик(row)[, размер иконки])}
+    header = view.horizontalHeader()
+    for column in range(view.model().columnCount()):
+        if column in actions:
+            header.setSectionResizeMode(column, QHeaderView.Fixed)
+            header.resizeSection(column, ACTION_COLUMN_WIDTH)
+            view.setItemDelegateForColumn(column, ActionDelegate(*actions[column], parent=view))
+        else:
+            header.setSectionResizeMode(column, QHeaderView.Stretch)
+    view.verticalHeader().setDefaultSectionSize(ACTION_ROW_HEIGHT)
+
+
+def is_action(view, index):
+    return isinstance(view.itemDelegateForColumn(index.column()), ActionDelegate)
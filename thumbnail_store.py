@@ -0,0 +1,242 @@
+import mmap
+import os
+import struct
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+from get import get_thumbnail_hashes, get_thumbnails
+
+THUMBNAIL_STORE_DIR = os.path.join(os.path.abspath(os.curdir), 'thumbnail_cache')
+THUMBNAIL_STORE_MAX_BYTES = 256 * 1024 * 1024
+THUMBNAIL_STORE_COMPACT_RATIO = 0.75
+THUMBNAIL_REVALIDATE_BATCH_SIZE = 1000
+
+# id_image, md5 миниатюры, смещение и длина в файле данных; смещение -1 удаляет запись из индекса.
+RECORD = struct.Struct('<q16sqq')
+REMOVED_OFFSET = -1
+
+
+class ThumbnailStore:
+    def __init__(self, path=THUMBNAIL_STORE_DIR, max_bytes=THUMBNAIL_STORE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._generation = None
+        self._data = None
+        self._map = None
+        self._index = {}
+        self._index_size = 0
+        self._recent = OrderedDict()
+        os.makedirs(path, exist_ok=True)
+
+    def get_many(self, image_ids):
+        images = {}
+        with self._lock:
+            self._refresh()
+            for id_image in image_ids:
+                entry = self._index.get(id_image)
+                data = self._read(entry[1], entry[2]) if entry is not None else None
+                if data is None:
+                    self.misses += 1
+                    continue
+                self.hits += 1
+                self._touch(id_image)
+                images[id_image] = data
+        return images
+
+    def put_many(self, images):
+        with self._lock, self._file_lock():
+            self._refresh()
+            records = []
+            with open(self._file(self._generation, 'dat'), 'ab') as data_file:
+                offset = data_file.seek(0, os.SEEK_END)
+                for id_image, image_hash, data in images:
+                    data_file.write(data)
+                    records.append(RECORD.pack(id_image, bytes.fromhex(image_hash), offset, len(data)))
+                    offset += len(data)
+            # Запись в индекс появляется только после того, как данные уже в файле.
+            with open(self._file(self._generation, 'idx'), 'ab') as index_file:
+                index_file.write(b''.join(records))
+            self._read_index()
+            for id_image, _, _ in images:
+                self._touch(id_image)
+            if offset > self.max_bytes:
+                self._compact()
+
+    def digests(self):
+        with self._lock:
+            self._refresh()
+            return {id_image: entry[0].hex() for id_image, entry in self._index.items()}
+
+    def discard(self, image_ids):
+        with self._lock, self._file_lock():
+            self._refresh()
+            with open(self._file(self._generation, 'idx'), 'ab') as index_file:
+                index_file.write(b''.join(RECORD.pack(id_image, bytes(16), REMOVED_OFFSET, 0)
+                                          for id_image in image_ids))
+            self._read_index()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'images': len(self._index)}
+
+    def close(self):
+        with self._lock:
+            self._close_files()
+
+    def _file(self, generation, extension):
+        return os.path.join(self.path, f'thumbnails.{generation}.{extension}')
+
+    def _current_generation(self):
+        try:
+            with open(os.path.join(self.path, 'CURRENT')) as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _refresh(self):
+        generation = self._current_generation()
+        if generation != self._generation:
+            self._open(generation)
+        self._read_index()
+
+    def _open(self, generation):
+        self._close_files()
+        self._generation = generation
+        self._index = {}
+        self._index_size = 0
+        for extension in ('dat', 'idx'):
+            open(self._file(generation, extension), 'ab').close()
+        self._data = open(self._file(generation, 'dat'), 'rb')
+
+    def _close_files(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._data is not None:
+            self._data.close()
+            self._data = None
+
+    def _read_index(self):
+        size = os.path.getsize(self._file(self._generation, 'idx'))
+        complete = (size - self._index_size) // RECORD.size * RECORD.size
+        if complete <= 0:
+            return
+        with open(self._file(self._generation, 'idx'), 'rb') as index_file:
+            index_file.seek(self._index_size)
+            chunk = index_file.read(complete)
+        for id_image, digest, offset, length in RECORD.iter_unpack(chunk):
+            if offset == REMOVED_OFFSET:
+                self._index.pop(id_image, None)
+            else:
+                self._index[id_image] = (digest, offset, length)
+        self._index_size += len(chunk)
+
+    def _read(self, offset, length):
+        if self._map is None or offset + length > len(self._map):
+            size = os.fstat(self._data.fileno()).st_size
+            if offset + length > size:
+                return None
+            if self._map is not None:
+                self._map.close()
+            self._map = mmap.mmap(self._data.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map[offset:offset + length]
+
+    def _touch(self, id_image):
+        self._recent[id_image] = None
+        self._recent.move_to_end(id_image)
+
+    def _compact(self):
+        # Недавно использованные этим процессом остаются первыми, остальные - в порядке добавления.
+        rank = {id_image: position for position, id_image in enumerate(self._recent)}
+        entries = sorted(self._index.items(), key=lambda item: (rank.get(item[0], -1), item[1][1]), reverse=True)
+        target = self.max_bytes * THUMBNAIL_STORE_COMPACT_RATIO
+        generation = self._generation + 1
+        kept = 0
+        with open(self._file(generation, 'dat'), 'wb') as data_file, \
+                open(self._file(generation, 'idx'), 'wb') as index_file:
+            for id_image, (digest, offset, length) in entries:
+                if kept + length > target:
+                    break
+                data = self._read(offset, length)
+                if data is None:
+                    continue
+                data_file.write(data)
+                index_file.write(RECORD.pack(id_image, digest, kept, length))
+                kept += length
+
+        current = os.path.join(self.path, 'CURRENT')
+        with open(current + '.tmp', 'w') as f:
+            f.write(str(generation))
+        os.replace(current + '.tmp', current)
+
+        self._open(generation)
+        self._read_index()
+        self._recent = OrderedDict((id_image, None) for id_image in self._recent if id_image in self._index)
+        self._remove_stale()
+
+    def _remove_stale(self):
+        for name in os.listdir(self.path):
+            parts = name.split('.')
+            if len(parts) == 3 and parts[0] == 'thumbnails' and parts[1] != str(self._generation):
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError:
+                    # Файл ещё открыт другим экземпляром, удалим при следующем сжатии.
+                    pass
+
+    @contextmanager
+    def _file_lock(self):
+        with open(os.path.join(self.path, 'LOCK'), 'a+b') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                else:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+thumbnail_store = ThumbnailStore()
+
+
+def load_thumbnails(image_ids):
+    # Локальному индексу доверяем без запроса к базе, устаревшие записи удаляет revalidate_thumbnails.
+    images = thumbnail_store.get_many(image_ids)
+    missing = [id_image for id_image in image_ids if id_image not in images]
+    if missing:
+        records = [(id_image, image_hash, bytes(data)) for id_image, data, image_hash in get_thumbnails(missing)
+                   if data is not None]
+        if records:
+            thumbnail_store.put_many(records)
+        images.update((id_image, data) for id_image, _, data in records)
+    return list(images.items())
+
+
+def revalidate_thumbnails(batch_size=THUMBNAIL_REVALIDATE_BATCH_SIZE):
+    # Сверяет хеши локального кеша с базой и удаляет записи изменённых или удалённых изображений.
+    digests = thumbnail_store.digests()
+    image_ids = sorted(digests)
+    stale = []
+    for start in range(0, len(image_ids), batch_size):
+        batch = image_ids[start:start + batch_size]
+        hashes = dict(get_thumbnail_hashes(batch))
+        stale.extend(id_image for id_image in batch if hashes.get(id_image) != digests[id_image])
+    if stale:
+        thumbnail_store.discard(stale)
+    return stale
@@ -0,0 +1,51 @@
+import psycopg2
+from PyQt5.QtCore import QBuffer, QByteArray, QIODevice, Qt
+from PyQt5.QtGui import QImageReader
+
+THUMBNAIL_SMALL = 150
+THUMBNAIL_LARGE = 370
+THUMBNAIL_FORMAT = 'PNG'
+
+
+def decode_image(source, size):
+    # source - путь к файлу или байты изображения.
+    buffer = None
+    if isinstance(source, str):
+        reader = QImageReader(source)
+    else:
+        buffer = QBuffer()
+        buffer.setData(QByteArray(bytes(source)))
+        buffer.open(QIODevice.ReadOnly)
+        reader = QImageReader(buffer)
+    reader.setAutoTransform(True)
+    # Декодер сразу уменьшает изображение, не разворачивая его в полном размере.
+    original_size = reader.size()
+    if original_size.isValid() and (original_size.width() > size or original_size.height() > size):
+        reader.setScaledSize(original_size.scaled(size, size, Qt.KeepAspectRatio))
+    image = reader.read()
+    if buffer is not None:
+        buffer.close()
+    return None if image.isNull() else image
+
+
+def encode_image(image, image_format, quality=-1):
+    data = QByteArray()
+    buffer = QBuffer(data)
+    buffer.open(QIODevice.WriteOnly)
+    image.save(buffer, image_format, quality)
+    buffer.close()
+    return bytes(data)
+
+
+def make_thumbnail(source, size):
+    image = decode_image(source, size)
+    if image is None:
+        return None
+    return encode_image(image, THUMBNAIL_FORMAT)
+
+
+def make_thumbnails(source):
+    small = make_thumbnail(source, THUMBNAIL_SMALL)
+    large = make_thumbnail(source, THUMBNAIL_LARGE)
+    return (psycopg2.Binary(small) if small is not None else None,
+            psycopg2.Binary(large) if large is not None else None)
@@ -285,6 +285,13 @@ class Ui_MainWindow(object):
         self.lineEditSearch.setStyleSheet("font: 63 10pt \"Segoe UI Variable Small Semibol\";")
         self.lineEditSearch.setObjectName("lineEditSearch")
         self.horizontalLayout_5.addWidget(self.lineEditSearch)
+        self.comboBoxSearchMode = QtWidgets.QComboBox(self.frame_3)
+        self.comboBoxSearchMode.setMinimumSize(QtCore.QSize(150, 35))
+        self.comboBoxSearchMode.setStyleSheet("font: 63 10pt \"Segoe UI Variable Small Semibol\";")
+        self.comboBoxSearchMode.setObjectName("comboBoxSearchMode")
+        self.comboBoxSearchMode.addItem("")
+        self.comboBoxSearchMode.addItem("")
+        self.horizontalLayout_5.addWidget(self.comboBoxSearchMode)
         self.gridLayout_2.addWidget(self.frame_3, 0, 0, 1, 1)
         self.tableProductOrder = QtWidgets.QTableView(self.frame)
         self.tableProductOrder.setStyleSheet("font: 63 10pt \"Segoe UI Variable Small Semibol\";")
@@ -987,6 +994,8 @@ class Ui_MainWindow(object):
         self.reports.setText(_translate("MainWindow", "Отчеты"))
         self.filters.setText(_translate("MainWindow", "фильтры"))
         self.search.setText(_translate("MainWindow", "поиск"))
+        self.comboBoxSearchMode.setItemText(0, _translate("MainWindow", "по названию"))
+        self.comboBoxSearchMode.setItemText(1, _translate("MainWindow", "по описанию"))
         self.placeOrder.setText(_translate("MainWindow", "оформить"))
         self.addCategories.setText(_translate("MainWindow", "добавить"))
         self.cancelCategories.setText(_translate("MainWindow", "отмена"))
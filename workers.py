@@ -0,0 +1,90 @@
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+from database import POOL_MAX_CONNECTIONS
+
+WORKER_THREADS = max(POOL_MAX_CONNECTIONS // 2, 1)
+
+
+class TaskSignals(QObject):
+    finished = pyqtSignal(str, int, object)
+    failed = pyqtSignal(str, int, object)
+
+
+class QueryTask(QRunnable):
+    def __init__(self, key, generation, function, args):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.key = key
+        self.generation = generation
+        self.function = function
+        self.args = args
+        self.signals = TaskSignals()
+
+    def run(self):
+        try:
+            result = self.function(*self.args)
+        except Exception as e:
+            self.signals.failed.emit(self.key, self.generation, e)
+            return
+        self.signals.finished.emit(self.key, self.generation, result)
+
+
+class QueryExecutor(QObject):
+    busy_changed = pyqtSignal(bool)
+
+    def __init__(self, max_threads=WORKER_THREADS, parent=None):
+        super().__init__(parent)
+        self._thread_pool = QThreadPool(self)
+        self._thread_pool.setMaxThreadCount(max_threads)
+        self._generations = {}
+        self._tasks = {}
+
+    def submit(self, key, function, *args, on_result=None, on_error=None):
+        self.cancel(key)
+        generation = self._generations.get(key, 0) + 1
+        self._generations[key] = generation
+
+        task = QueryTask(key, generation, function, args)
+        task.signals.finished.connect(self._on_finished)
+        task.signals.failed.connect(self._on_failed)
+        self._tasks[(key, generation)] = (task, on_result, on_error)
+        if len(self._tasks) == 1:
+            self.busy_changed.emit(True)
+        self._thread_pool.start(task)
+        return generation
+
+    def cancel(self, key):
+        generation = self._generations.get(key)
+        if generation is None:
+            return
+        self._generations[key] = generation + 1
+        entry = self._tasks.get((key, generation))
+        if entry is not None and self._thread_pool.tryTake(entry[0]):
+            self._finish(key, generation)
+
+    def is_current(self, key, generation):
+        return self._generations.get(key) == generation
+
+    def shutdown(self):
+        self._thread_pool.clear()
+        self._thread_pool.waitForDone()
+
+    def _on_finished(self, key, generation, result):
+        entry = self._finish(key, generation)
+        if entry is not None and self.is_current(key, generation) and entry[1] is not None:
+            entry[1](result)
+
+    def _on_failed(self, key, generation, error):
+        entry = self._finish(key, generation)
+        if entry is None or not self.is_current(key, generation):
+            return
+        if entry[2] is not None:
+            entry[2](error)
+        else:
+            print(f'Ошибка: {error}')
+
+    def _finish(self, key, generation):
+        entry = self._tasks.pop((key, generation), None)
+        if entry is not None and not self._tasks:
+            self.busy_changed.emit(False)
+        return entry